@@ -0,0 +1,225 @@
+'''
+Times every stage of generating the dataset, without a display.
+
+Each stage runs on the same batch of poses: pose generation, node
+transform, face sorting/culling, rasterization, image encode/save, label
+save and conversion, then a whole headless run with the workers. Results
+are written as json so runs on different commits can be compared.
+
+python benchmark.py -n 2000 --width 256 --subdivisions 4 -w 4 -o before.json
+python benchmark.py -n 2000 --width 256 --subdivisions 4 -w 4 --compare before.json
+
+It also exits with 1 if any frame renders blank, so big meshes
+(--subdivisions 41 is about 10k faces) check the face culling too.
+'''
+import io
+import os
+import sys
+import json
+import time
+import argparse
+import datetime
+import tempfile
+import contextlib
+import subprocess
+import numpy as np
+import wireframe as wf
+from projector import Projector
+from renderer import NumpyRenderer
+from img_converter import parse_target, convert_image
+from samplers import create_sampler
+
+def create_subdivided_cube(subdivisions=1):
+    '''
+    Create the cube with every face split into subdivisions x subdivisions
+    quads, so the node and face counts can be scaled up.
+    Args:
+        :param subdivisions: (int) how many quads along each edge of a face
+    '''
+    cube = wf.create_cube()
+    corners = cube.nodes_initial[:,:3]
+    steps = np.linspace(0, 1, subdivisions + 1)
+    nodes, faces, facecolors = [], [], []
+    for face, color in zip(cube.faces, cube.facecolors):
+        c0, c1, _, c3 = corners[face]
+        # a (subdivisions+1) x (subdivisions+1) grid of nodes over the face
+        grid = c0 + steps[:,None,None]*(c1 - c0) + steps[None,:,None]*(c3 - c0)
+        first = sum(len(n) for n in nodes)
+        nodes.append(grid.reshape(-1, 3))
+        index = first + np.arange((subdivisions + 1)**2).reshape(subdivisions + 1, subdivisions + 1)
+        # quads wound the same way as the face
+        quads = np.stack((index[:-1,:-1], index[1:,:-1], index[1:,1:], index[:-1,1:]), axis=2)
+        faces.append(quads.reshape(-1, 4))
+        facecolors.append(np.tile(color, (len(faces[-1]), 1)))
+    nodes = np.concatenate(nodes)
+    nodecolors = np.full((len(nodes), 3), 255)
+    return wf.Wireframe(nodes, nodecolors, np.concatenate(faces), np.concatenate(facecolors))
+
+def best_time(fn, repeat=3):
+    '''
+    Return the best time of repeat calls of fn, in seconds, and its last result.
+    '''
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+def run_benchmark(step_size=0.3, frames=2000, width=256, height=256, subdivisions=1,
+                  workers=1, sampler='grid', repeat=3):
+    '''
+    Time every stage of the pipeline.
+    Args:
+        :param step_size: (float) the step size of the euler grid
+        :param frames: (int) how many frames every stage works on
+        :param width: (int) width of the images
+        :param height: (int) height of the images
+        :param subdivisions: (int) how many quads along each edge of a cube face
+        :param workers: (int) how many processes the whole run uses
+        :param sampler: (str) the pose sampler, see samplers.create_sampler
+        :param repeat: (int) how many times to run each stage, the best time counts
+    Returns:
+        (dict) the settings and the seconds and frames per second of every stage
+    '''
+    cube = create_subdivided_cube(subdivisions)
+    poses = create_sampler(sampler, step_size, frames)
+    frames = min(frames, len(poses))
+    center = (width//2, height//2, 0)
+    stages = {}
+    def stage(name, fn, count=frames):
+        seconds, result = best_time(fn, repeat)
+        stages[name] = {'seconds': seconds, 'frames_per_second': count / seconds if seconds else None}
+        return result
+
+    seq = stage('poses', lambda: poses[:frames])
+    nodes = stage('transform', lambda: cube.transform_batch(seq, center))
+    stage('sort_cull', lambda: cube.visible_faces(nodes))
+    renderer = NumpyRenderer(width, height)
+    images = stage('rasterize_numpy', lambda: renderer.render([cube], [nodes]))
+    # every pose shows some of the cube, a blank frame means faces got culled
+    blank = int((images == np.array(renderer.background, dtype=np.uint8)).all(axis=(1,2,3)).sum())
+    try:
+        from renderer import PygameRenderer
+        pygame_renderer = PygameRenderer(width, height)
+        stage('rasterize_pygame', lambda: pygame_renderer.render([cube], [nodes]))
+    except ImportError:
+        pass
+
+    with tempfile.TemporaryDirectory() as folder, contextlib.redirect_stdout(io.StringIO()):
+        # every stage that writes files runs in its own folder
+        cwd = os.getcwd()
+        os.chdir(folder)
+        try:
+            os.makedirs('data')
+            os.makedirs('imgs_bmp')
+            os.makedirs('imgs_jpg')
+            p = Projector(width, height, None, True, True, step_size, renderer='numpy')
+            p.sampler = poses
+            p.add_wireframe('cube1', cube)
+            p.outputs = [parse_target('imgs_bmp::bmp')]
+            stage('encode_save', lambda: [p.save_image(image, 'cube1', i+1)
+                                          for i, image in enumerate(images)])
+            def save_labels():
+                labels = p.create_label_files(frames)
+                labels['cube1'][:] = p.create_labels(nodes, seq)
+                labels['cube1'].flush()
+            stage('label_save', save_labels)
+            targets = [parse_target('imgs_jpg:64x64:jpg')]
+            def convert():
+                # the converter skips up to date outputs, start from none
+                for name in os.listdir('imgs_jpg'):
+                    os.remove(os.path.join('imgs_jpg', name))
+                for name in os.listdir('imgs_bmp'):
+                    convert_image(os.path.join('imgs_bmp', name), targets)
+            stage('convert', convert)
+            p.limit_samples = frames
+            p.workers = workers
+            stage('run', p.run)
+        finally:
+            os.chdir(cwd)
+
+    return {
+        'commit': git_commit(),
+        'date': datetime.datetime.now().strftime('%Y-%m-%d-%H-%M-%S'),
+        'numpy': np.__version__,
+        'settings': {'step_size': step_size, 'frames': frames, 'width': width, 'height': height,
+                     'subdivisions': subdivisions, 'nodes': len(cube.nodes), 'faces': len(cube.faces),
+                     'workers': workers, 'sampler': sampler},
+        'repeat': repeat,
+        'blank_frames': blank,
+        'stages': stages,
+    }
+
+def compare(results, baseline, threshold=1.2):
+    '''
+    Print how much slower or faster every stage is than in a baseline.
+    Args:
+        :param results: (dict) results from run_benchmark
+        :param baseline: (dict) older results to compare to
+        :param threshold: (float) how many times slower a stage can get
+    Returns:
+        (list) the stages that got slower than the threshold
+    '''
+    if results['settings'] != baseline['settings']:
+        print(f'warning: the settings differ from the baseline {baseline["settings"]}')
+    slower = []
+    for name, stage in results['stages'].items():
+        if name not in baseline['stages']:
+            continue
+        # a stage too fast to time has no rate to compare
+        if not stage['frames_per_second'] or not baseline['stages'][name]['frames_per_second']:
+            print(f'{name}: n/a, too fast to time')
+            continue
+        # per frame, so runs of different lengths still compare
+        ratio = baseline['stages'][name]['frames_per_second'] / stage['frames_per_second']
+        print(f'{name}: {ratio:.2f}x the time per frame of {baseline["commit"]}')
+        if ratio > threshold:
+            slower.append(name)
+    return slower
+
+def git_commit():
+    '''
+    Return the commit we are on, None if we aren't in a git repo.
+    '''
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def parse_args(args):
+    p = argparse.ArgumentParser()
+    p.add_argument('-s', '--step-size', type=float, default=0.3, help='The step size for the rotations.')
+    p.add_argument('-n', '--frames', type=int, default=2000, help='How many frames every stage works on.')
+    p.add_argument('--width', type=int, default=256, help='The width of the images.')
+    p.add_argument('--height', type=int, default=256, help='The height of the images.')
+    p.add_argument('--subdivisions', type=int, default=1, help='Split every cube face into this many quads along each edge.')
+    p.add_argument('-w', '--workers', type=int, default=1, help='How many processes the whole run uses.')
+    p.add_argument('--sampler', type=str, default='grid', choices=['grid', 'random', 'fibonacci', 'hopf'], help='How to pick the poses.')
+    p.add_argument('-r', '--repeat', type=int, default=3, help='How many times to run each stage, the best time counts.')
+    p.add_argument('-o', '--out', type=str, help='The json file to write the results to.')
+    p.add_argument('-c', '--compare', type=str, help='A json file of earlier results to compare to.')
+    p.add_argument('-t', '--threshold', type=float, default=1.2, help='How many times slower a stage can get before --compare fails.')
+    return p.parse_args(args)
+
+if __name__ == '__main__':
+    args = parse_args(sys.argv[1:]).__dict__
+    results = run_benchmark(args['step_size'], args['frames'], args['width'], args['height'],
+                            args['subdivisions'], args['workers'], args['sampler'], args['repeat'])
+    for name, stage in results['stages'].items():
+        rate = 'n/a' if stage['frames_per_second'] is None else f'{stage["frames_per_second"]:.1f}'
+        print(f'{name}: {stage["seconds"]:.4f}s, {rate} frames/s')
+    if results['blank_frames']:
+        print(f'{results["blank_frames"]} frames rendered blank')
+    if args['out']:
+        with open(args['out'], 'w') as f:
+            json.dump(results, f, indent=2)
+    if args['compare']:
+        with open(args['compare']) as f:
+            slower = compare(results, json.load(f), args['threshold'])
+        if slower:
+            print(f'slower than the baseline: {", ".join(slower)}')
+            sys.exit(1)
+    if results['blank_frames']:
+        sys.exit(1)
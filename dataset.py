@@ -0,0 +1,144 @@
+'''
+An in memory, procedural version of the dataset.
+
+Poses are rendered on the fly with the headless numpy renderer, so you can
+train at any resolution or pose density without rendering the dataset to
+disk first. Iterating gives (images, labels) batches, images are uint8
+B x H x W x 3 and labels are the usual B x NODES x 6 (positions, rotations).
+Poses come from the samplers in samplers.py and images are drawn straight
+at the size asked for, like projector.py --render-size WxH --antialias K,
+so streamed data looks like a generated dataset.
+
+    dataset = ProceduralDataset(wf.create_cube(), size=(64, 64), step_size=0.3, workers=4)
+    dataset = ProceduralDataset(wf.create_cube(), size=(64, 64), sampler='hopf', antialias=4)
+    for images, labels in dataset:
+        ...
+'''
+
+import collections
+import multiprocessing
+import numpy as np
+from PIL import Image
+from projector import Projector
+from samplers import create_sampler
+
+class ProceduralDataset(object):
+    '''
+    Iterable dataset of rendered poses, the euler grid of a step size (like
+    Projector.run) or rotations from one of the other samplers.
+    '''
+    def __init__(self, wireframes, size=(256, 256), step_size=None, frames=10000,
+                 batch_size=64, shuffle=False, seed=None, workers=0, prefetch=2,
+                 sampler=None, antialias=1):
+        '''
+        Args:
+            :param wireframes: (Wireframe or dict) the wireframe or a dict of name ->
+            wireframe, the labels are for the first one
+            :param size: (tuple) width, height of the images
+            :param step_size: (float) the step size of the euler grid
+            :param frames: (int) how many poses of the other samplers make an epoch
+            :param batch_size: (int) how many frames per batch
+            :param shuffle: (bool) shuffle the poses every epoch
+            :param seed: (int) seed for the poses and shuffling, every epoch
+            gets its own poses from it
+            :param workers: (int) how many processes render batches, 0 renders
+            in this process
+            :param prefetch: (int) how many batches per worker to render ahead
+            :param sampler: (str) grid, random, fibonacci or hopf, see
+            samplers.create_sampler, defaults to grid with a step size and
+            random (uniform over all rotations) without
+            :param antialias: (int) how many points per pixel along each axis
+            to average, 1 for hard edges
+        '''
+        if not isinstance(wireframes, dict):
+            wireframes = {'cube1': wireframes}
+        # the wireframes are made for 256x256, they are drawn scaled to the
+        # size we want, sizes of another shape are resized afterwards
+        self.projector = Projector(256, 256, None, False, False, step_size, renderer='numpy')
+        for name, wireframe in wireframes.items():
+            self.projector.add_wireframe(name, wireframe)
+        self.size = tuple(size)
+        self.projector.antialias = antialias
+        render_size = self.size
+        if self.size[0] * self.projector.height != self.size[1] * self.projector.width:
+            render_size = None
+        self.renderer = self.projector.create_renderer(render_size)
+        if sampler is None:
+            sampler = 'random' if step_size is None else 'grid'
+        self.sampler = sampler
+        self.step_size = step_size
+        self.frames = frames
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.seed = seed
+        self.workers = workers
+        self.prefetch = prefetch
+        self.epoch = 0
+        if sampler == 'grid':
+            self.frames = len(create_sampler('grid', step_size))
+
+    def __len__(self):
+        return -(-self.frames // self.batch_size)
+
+    def poses(self):
+        '''
+        Return the poses of the next epoch, F x 3 x,y,z rotations in radians.
+        '''
+        seed = None
+        if self.seed is not None:
+            seed = int(np.random.SeedSequence((self.seed, self.epoch)).generate_state(1)[0])
+        self.epoch += 1
+        poses = create_sampler(self.sampler, self.step_size, self.frames, seed)[:]
+        if self.shuffle:
+            return poses[np.random.default_rng(seed).permutation(len(poses))]
+        return poses
+
+    def render_batch(self, rotations):
+        '''
+        Render a batch of poses.
+        Args:
+            :param rotations: (numpy array) F x 3 x,y,z rotations in radians
+        Returns:
+            (tuple) F x H x W x 3 uint8 images and F x NODES x 6 labels
+        '''
+        projector = self.projector
+        key = list(projector.wireframes.keys())[0]
+        batch = projector.transform_all_batch(rotations)
+        labels = projector.create_labels(batch[key], rotations)
+        images = self.renderer.render(list(projector.wireframes.values()), list(batch.values()))
+        if images.shape[1:3] != (self.size[1], self.size[0]):
+            images = np.stack([np.asarray(Image.fromarray(image).resize(self.size)) for image in images])
+        return images, labels
+
+    def __iter__(self):
+        poses = self.poses()
+        batches = (poses[i:i+self.batch_size] for i in range(0, len(poses), self.batch_size))
+        if not self.workers:
+            for rotations in batches:
+                yield self.render_batch(rotations)
+            return
+        # keep a bounded number of batches rendering ahead of the consumer
+        with multiprocessing.Pool(self.workers, initializer=init_worker, initargs=(self,)) as pool:
+            pending = collections.deque()
+            for rotations in batches:
+                pending.append(pool.apply_async(render_worker_batch, (rotations,)))
+                if len(pending) >= self.workers * self.prefetch:
+                    yield pending.popleft().get()
+            while pending:
+                yield pending.popleft().get()
+
+# the dataset of a worker process, sent once when the worker starts
+worker_dataset = None
+
+def init_worker(dataset):
+    '''
+    Keep the dataset in the worker process.
+    '''
+    global worker_dataset
+    worker_dataset = dataset
+
+def render_worker_batch(rotations):
+    '''
+    Render a batch in a worker process.
+    '''
+    return worker_dataset.render_batch(rotations)
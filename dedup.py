@@ -0,0 +1,118 @@
+'''
+Finds frames that look the same as an earlier frame.
+
+The euler grid reaches the same orientation along several paths and a
+symmetric wireframe looks the same from several orientations, so many
+frames carry no new information. Every frame gets a key from its node
+positions, rounded to a quantum and hashed together with the colors, that
+ignores which node is which. Frames with the same key look the same, the
+first of them is the canonical frame and the rest point to it. Optionally
+rendered images are hashed too, to catch duplicates the poses miss.
+
+    index = DedupIndex([cube])
+    canonical = index.add_poses(frames, [nodes])
+    # frames where canonical != frames don't need rendering
+'''
+
+import hashlib
+import numpy as np
+
+class DedupIndex(object):
+    '''
+    Maps every frame to the first frame that looks the same.
+    '''
+    def __init__(self, wireframes, quantum=0.5):
+        '''
+        Args:
+            :param wireframes: (list) the wireframes of the scene, in order
+            :param quantum: (float) node positions closer than about this many
+            pixels count as the same
+        '''
+        self.wireframes = wireframes
+        self.quantum = quantum
+        # key -> canonical frame, one dict for poses and one for images
+        self.poses = {}
+        self.images = {}
+
+    def pose_keys(self, poses):
+        '''
+        Return a key for every frame of a batch of poses.
+        Args:
+            :param poses: (list) one F x N x 4 array of node positions per wireframe
+        Returns:
+            (numpy array) F x 2 uint64, 128 bit keys
+        '''
+        hashes = []
+        for wireframe, nodes in zip(self.wireframes, poses):
+            positions = mix(np.round(nodes[:,:,:3] / self.quantum).astype(np.int64))
+            # a node is its position and color, whichever node it is
+            nodecolors = np.zeros((nodes.shape[1], 3), dtype=np.int64)
+            if len(wireframe.nodecolors):
+                nodecolors = np.asarray(wireframe.nodecolors, dtype=np.int64)
+            colors = np.broadcast_to(nodecolors, positions.shape + (3,))
+            node_keys = mix(np.concatenate((positions.view(np.int64)[...,None], colors), axis=2))
+            hashes.append(np.sort(node_keys, axis=1))
+            # a face is its corners and color, whichever face it is
+            if len(wireframe.faces):
+                faces = np.asarray(wireframe.faces)
+                corners = np.sort(positions[:,faces], axis=2).view(np.int64)
+                colors = np.broadcast_to(np.asarray(wireframe.facecolors, dtype=np.int64),
+                                         corners.shape[:2] + (3,))
+                face_keys = mix(np.concatenate((corners, colors), axis=2))
+                hashes.append(np.sort(face_keys, axis=1))
+        hashes = np.concatenate(hashes, axis=1).view(np.int64)
+        return np.stack((mix(hashes, 0), mix(hashes, 1)), axis=1)
+
+    def add_poses(self, frames, poses):
+        '''
+        Add a batch of frames by their poses.
+        Args:
+            :param frames: (numpy array) the global index of every frame, frames
+            must be added in order for the first one to be canonical
+            :param poses: (list) one F x N x 4 array of node positions per wireframe
+        Returns:
+            (numpy array) the canonical frame of every frame
+        '''
+        return self.add(self.poses, frames, self.pose_keys(poses))
+
+    def add_images(self, frames, images):
+        '''
+        Add a batch of rendered frames by their pixels.
+        Args:
+            :param frames: (numpy array) the global index of every frame
+            :param images: (numpy array) F x H x W x 3 uint8 images
+        Returns:
+            (numpy array) the canonical frame of every frame
+        '''
+        keys = np.array([np.frombuffer(hashlib.blake2b(image.tobytes(), digest_size=16).digest(),
+                                       dtype=np.uint64) for image in images]).reshape(-1, 2)
+        return self.add(self.images, frames, keys)
+
+    def add(self, index, frames, keys):
+        '''
+        Look the keys up in index, adding the ones that aren't there yet.
+        '''
+        canonical = np.array(frames, dtype=np.int64)
+        for i, key in enumerate(np.ascontiguousarray(keys).view('V16').ravel().tolist()):
+            canonical[i] = index.setdefault(key, canonical[i])
+        return canonical
+
+def mix(values, seed=2):
+    '''
+    Hash the last axis of an int64 array to one uint64, a random linear
+    combination (which wraps around) followed by the splitmix64 finalizer.
+    Args:
+        :param values: (numpy array) ... x D int64 values
+        :param seed: (int) picks the hash
+    Returns:
+        (numpy array) ... uint64 hashes
+    '''
+    values = np.ascontiguousarray(values, dtype=np.int64).view(np.uint64)
+    multipliers = np.random.default_rng(seed).integers(1, 2**63, values.shape[-1], dtype=np.uint64)
+    h = (values * (multipliers | np.uint64(1))).sum(axis=-1, dtype=np.uint64)
+    h ^= h >> np.uint64(30)
+    h *= np.uint64(0xbf58476d1ce4e5b9)
+    h ^= h >> np.uint64(27)
+    h *= np.uint64(0x94d049bb133111eb)
+    h ^= h >> np.uint64(31)
+    return h
@@ -5,44 +5,138 @@ converts bitmap (.bmp) files output by the pygame generator
 to jpeg (.jpg) or PNG (.png) files with no compress/data loss. Can also
 be used to resize the output files.
 
+Every source image is decoded once and written to as many targets (output
+folder, size, format) as you like, with a pool of processes. Outputs that
+are newer than their source are skipped so runs can be repeated cheaply.
+
+python img_converter.py -i imgs_bmp -t imgs_jpg_32:32x32:jpg -t imgs_jpg_64:64x64:jpg
 '''
 import os
 import sys
+import time
 import glob
 import argparse
+import functools
+import multiprocessing
 from PIL import Image
 
+def parse_target(target):
+    '''
+    Parse a target of the form folder:WIDTHxHEIGHT:format[:quality],
+    the size can be left empty to keep the size of the source.
+    Args:
+        :param target: (str) the target to parse
+    Returns:
+        (tuple) folder, size (or None), PIL format, file extension, quality
+    '''
+    parts = target.split(':')
+    if len(parts) not in (3, 4):
+        raise argparse.ArgumentTypeError(f'{target} should look like folder:WIDTHxHEIGHT:format[:quality]')
+    out, size, format = parts[:3]
+    quality = int(parts[3]) if len(parts) == 4 else 100
+    if size:
+        size = tuple(int(d) for d in size.lower().split('x'))
+    else:
+        size = None
+    format = format.upper()
+    ext = format.lower()
+    if format == 'JPG': format = 'JPEG'
+    return out, size, format, ext, quality
+
+def iter_images(path, ext='.bmp'):
+    '''
+    Stream the paths of the images in a folder (and its subfolders) without
+    building a list of all of them first.
+    Args:
+        :param path: (str) the folder to look in
+        :param ext: (str) the extension of the images to convert
+    '''
+    with os.scandir(path) as entries:
+        for entry in entries:
+            if entry.is_dir():
+                yield from iter_images(entry.path, ext)
+            elif entry.name.lower().endswith(ext):
+                yield entry.path
+
+def convert_image(img_path, targets):
+    '''
+    Convert one image to every target, the image is only read if at least
+    one target is missing or older than it.
+    Args:
+        :param img_path: (str) the image to convert
+        :param targets: (list) targets from parse_target
+    Returns:
+        (int) how many outputs were written
+    '''
+    _, basename = os.path.split(img_path)
+    basename, _ = os.path.splitext(basename)
+    mtime = os.stat(img_path).st_mtime
+    img = None
+    written = 0
+    for out, size, format, ext, quality in targets:
+        saveto = os.path.join(f'{out}', f'{basename}.{ext}')
+        # skip outputs that are already up to date
+        if os.path.exists(saveto) and os.stat(saveto).st_mtime >= mtime:
+            continue
+        if img is None:
+            img = Image.open(img_path)
+            img.load()
+        resized = img.resize(size) if size else img
+        # save to a temporary file first so a killed conversion never leaves
+        # a half written output that looks up to date
+        resized.save(saveto + '.tmp', format=format, subsampling=0, quality=quality)
+        os.replace(saveto + '.tmp', saveto)
+        written += 1
+    return written
+
 def parse_args(args):
     p = argparse.ArgumentParser()
     p.add_argument('-g', '--glob', type=str, help='Unix style glob path to the images you want to convert.')
+    p.add_argument('-i', '--input', type=str, help='A folder of images to convert, faster than a glob for huge folders.')
+    p.add_argument('-e', '--ext', type=str, default='.bmp', help='The extension of the images to convert in --input.')
     p.add_argument('-o', '--out', type=str, help='The output path (folder) to put all the files.')
     p.add_argument('-d1', '--dim1', type=int, help='The first (height) dimension of the image.')
     p.add_argument('-d2', '--dim2', type=int, help='The second (width) dimension of the image.')
     p.add_argument('-f', '--format', type=str, help='The output format, JPEG, or PNG, BMP.')
+    p.add_argument('-t', '--target', type=parse_target, action='append', default=[],
+                   help='An output folder:WIDTHxHEIGHT:format[:quality], can be given many times.')
+    p.add_argument('-w', '--workers', type=int, default=os.cpu_count(), help='How many processes convert images.')
     return p.parse_args(args)
 
 if __name__ == '__main__':
     args = parse_args(sys.argv[1:]).__dict__
     g = args['glob']
+    inp = args['input']
+    ext = args['ext']
     out = args['out']
     dim1 = args['dim1']
     dim2 = args['dim2']
-    format = args['format'].upper()
-    ext = format.lower()
+    format = args['format']
+    targets = args['target']
+    workers = args['workers']
 
-    if format == 'JPG': format = 'JPEG'
+    # the old single target arguments still work
+    if out and format:
+        size = f'{dim1}x{dim2}' if dim1 and dim2 else ''
+        targets.append(parse_target(f'{out}:{size}:{format}'))
+    for target in targets:
+        os.makedirs(target[0], exist_ok=True)
 
-    img_paths = glob.glob(g)
+    if inp:
+        img_paths = iter_images(inp, ext.lower())
+    else:
+        img_paths = glob.iglob(g)
 
-    for i, img_path in enumerate(img_paths):
-        img = Image.open(img_path)
-        path, basename = os.path.split(img_path)
-        basename, _ = os.path.splitext(basename)
-        if dim1 and dim2:
-            img = img.resize((dim1,dim2))
-        saveto = os.path.join(f'{out}', f'{basename}.{ext}')
-        if not i % 25000:
-            prog = i / len(img_paths)
-            print(f'{prog}%')
-            print(f'saving this iteration to {saveto}')
-        img.save(saveto, format=format, subsampling=0, quality=100)
+    convert = functools.partial(convert_image, targets=targets)
+    start = last_print = time.time()
+    written = 0
+    with multiprocessing.Pool(workers) as pool:
+        for i, n in enumerate(pool.imap_unordered(convert, img_paths, chunksize=64), 1):
+            written += n
+            # report the throughput every 10 seconds
+            if time.time() - last_print > 10:
+                last_print = time.time()
+                elapsed = last_print - start
+                print(f'{i} images ({written} outputs written) in {elapsed:.1f}s, {i/elapsed:.1f} images/s')
+    elapsed = time.time() - start
+    print(f'done, {written} outputs written in {elapsed:.1f}s')
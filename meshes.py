@@ -0,0 +1,284 @@
+'''
+Loads wireframes from mesh files, so datasets can use real objects
+instead of hand written node lists.
+
+OBJ files take their face colors from the Kd colors of their materials
+(usemtl/mtllib) and their node colors from vertex colors (v x y z r g b).
+PLY files, ascii or binary, take them from red/green/blue properties of
+their faces and vertices. Triangles, quads and other convex polygons can
+be mixed, shorter faces repeat their last node so every face has as many
+nodes as the longest one.
+
+    cube = load_mesh('models/teapot.obj')
+    p.add_wireframe('teapot', cube)
+'''
+
+import os
+import numpy as np
+from wireframe import Wireframe
+
+# colors for meshes that don't have any
+DEFAULT_FACE_COLOR = (200, 200, 200)
+DEFAULT_NODE_COLOR = (255, 255, 255)
+
+def load_mesh(path, size=100, dtype=np.float64):
+    '''
+    Load a wireframe from an .obj or .ply file.
+    Args:
+        :param path: (str) the mesh file
+        :param size: (numeric) scale the mesh so its longest side is this
+        long and its smallest corner is at 0,0,0 like the cube, None to
+        keep the coordinates of the file
+        :param dtype: (numpy dtype) the type to store the nodes as
+    Returns:
+        (Wireframe) the mesh
+    '''
+    ext = os.path.splitext(path)[1].lower()
+    if ext == '.obj':
+        nodes, nodecolors, faces, facecolors = read_obj(path)
+    elif ext == '.ply':
+        nodes, nodecolors, faces, facecolors = read_ply(path)
+    else:
+        raise ValueError(f'{path} is not an .obj or .ply file')
+    # faces with no area (repeated or collinear nodes) have no normal
+    flat = face_areas(nodes, faces) <= 1e-12 * np.ptp(nodes, axis=0).max(initial=0)**2
+    if flat.any():
+        print(f'skipping {flat.sum()} faces with no area in {path}')
+        faces, facecolors = faces[~flat], facecolors[~flat]
+    if size is not None:
+        nodes = nodes - nodes.min(axis=0)
+        extent = nodes.max()
+        if extent > 0:
+            nodes = nodes * (size / extent)
+    return Wireframe(nodes, nodecolors, faces, facecolors, dtype=dtype)
+
+def face_areas(nodes, faces):
+    '''
+    Return the area of every face, padded faces included.
+    Args:
+        :param nodes: (numpy array) N x 3 node positions
+        :param faces: (numpy array) Faces x Z node indices
+    '''
+    corners = nodes[faces]
+    # half the sum of the cross products of the corners in order
+    cross = np.cross(corners, np.roll(corners, -1, axis=1)).sum(axis=1)
+    return np.linalg.norm(cross, axis=-1) / 2
+
+def pad_faces(faces):
+    '''
+    Turn a list of faces with any number of nodes into a Faces x Z array,
+    shorter faces repeat their last node.
+    '''
+    if not len(faces):
+        # a mesh of only points
+        return np.zeros((0, 3), dtype=np.int64)
+    counts = np.array([len(face) for face in faces])
+    if (counts == counts[0]).all():
+        return np.array(faces, dtype=np.int64)
+    padded = np.zeros((len(faces), counts.max(initial=3)), dtype=np.int64)
+    flat = np.concatenate(faces).astype(np.int64)
+    rows = np.repeat(np.arange(len(faces)), counts)
+    cols = np.arange(len(flat)) - np.repeat(np.cumsum(counts) - counts, counts)
+    padded[:] = flat[np.cumsum(counts) - 1][:,None]
+    padded[rows, cols] = flat
+    return padded
+
+def read_obj(path):
+    '''
+    Read the nodes, node colors, faces and face colors of an .obj file.
+    '''
+    with open(path) as f:
+        lines = f.read().splitlines()
+    # every face keeps how many vertices came before it, negative
+    # indices count back from there
+    vertices, faces, face_vertices, face_materials, materials = [], [], [], [], {}
+    material = None
+    for line in lines:
+        if line.startswith('v '):
+            vertices.append(line[2:])
+        elif line.startswith('f '):
+            faces.append(line[2:].split())
+            face_vertices.append(len(vertices))
+            face_materials.append(material)
+        elif line.startswith('usemtl '):
+            material = line[7:].strip()
+        elif line.startswith('mtllib '):
+            materials.update(read_mtl(os.path.join(os.path.dirname(path), line[7:].strip())))
+    # x y z, maybe w (ignored) or r g b after them
+    columns = [len(vertex.split()) for vertex in vertices]
+    if len(set(columns)) <= 1:
+        # every line is the same, parse all the vertices at once
+        values = np.array(' '.join(vertices).split(), dtype=float)
+        values = values.reshape(len(vertices), columns[0] if vertices else 3)
+        nodes = values[:,:3]
+        colored = np.full(len(nodes), values.shape[1] >= 6)
+        colors = values[:,3:6] if values.shape[1] >= 6 else np.zeros((len(nodes), 3))
+    else:
+        rows = [[float(v) for v in vertex.split()] for vertex in vertices]
+        nodes = np.array([row[:3] for row in rows])
+        colored = np.array([len(row) >= 6 for row in rows])
+        colors = np.array([row[3:6] if len(row) >= 6 else [0, 0, 0] for row in rows], dtype=float)
+    nodecolors = np.tile(DEFAULT_NODE_COLOR, (len(nodes), 1))
+    if colored.any():
+        # colors are either 0-1 or 0-255
+        scale = 255 if colors[colored].max() <= 1 else 1
+        nodecolors[colored] = np.round(colors[colored] * scale).astype(int)
+    # f v/vt/vn, only the vertex matters, indices start at 1 or count back
+    # from the last vertex before the face
+    faces = [[int(token.split('/')[0]) for token in face] for face in faces]
+    faces = [[i - 1 if i > 0 else count + i for i in face] for face, count in zip(faces, face_vertices)]
+    facecolors = np.array([materials.get(m, DEFAULT_FACE_COLOR) for m in face_materials]).reshape(-1, 3)
+    return nodes, nodecolors, pad_faces(faces), facecolors
+
+def read_mtl(path):
+    '''
+    Read the Kd colors of the materials in an .mtl file.
+    Returns:
+        (dict) material name -> RGB color
+    '''
+    materials = {}
+    if not os.path.exists(path):
+        return materials
+    name = None
+    with open(path) as f:
+        for line in f:
+            parts = line.split()
+            if not parts:
+                continue
+            if parts[0] == 'newmtl':
+                name = parts[1]
+            elif parts[0] == 'Kd' and name is not None:
+                materials[name] = tuple(int(round(float(c) * 255)) for c in parts[1:4])
+    return materials
+
+PLY_TYPES = {'char': 'i1', 'int8': 'i1', 'uchar': 'u1', 'uint8': 'u1',
+             'short': 'i2', 'int16': 'i2', 'ushort': 'u2', 'uint16': 'u2',
+             'int': 'i4', 'int32': 'i4', 'uint': 'u4', 'uint32': 'u4',
+             'float': 'f4', 'float32': 'f4', 'double': 'f8', 'float64': 'f8'}
+
+def read_ply(path):
+    '''
+    Read the nodes, node colors, faces and face colors of a .ply file.
+    '''
+    with open(path, 'rb') as f:
+        if f.readline().strip() != b'ply':
+            raise ValueError(f'{path} is not a ply file')
+        # the header lists the elements and their properties
+        format, elements = None, []
+        while True:
+            line = f.readline().decode('ascii').split()
+            if not line or line[0] == 'end_header':
+                break
+            if line[0] == 'format':
+                format = line[1]
+            elif line[0] == 'element':
+                elements.append((line[1], int(line[2]), []))
+            elif line[0] == 'property':
+                if line[1] == 'list':
+                    elements[-1][2].append((line[4], 'list', PLY_TYPES[line[2]], PLY_TYPES[line[3]]))
+                else:
+                    elements[-1][2].append((line[2], PLY_TYPES[line[1]]))
+        if format == 'ascii':
+            data = read_ply_ascii(f, elements)
+        else:
+            endian = '<' if format == 'binary_little_endian' else '>'
+            data = read_ply_binary(f, elements, endian)
+    vertex, face = data['vertex'], data.get('face', {})
+    nodes = np.stack((vertex['x'], vertex['y'], vertex['z']), axis=1).astype(float)
+    nodecolors = np.tile(DEFAULT_NODE_COLOR, (len(nodes), 1))
+    if 'red' in vertex:
+        nodecolors = np.stack((vertex['red'], vertex['green'], vertex['blue']), axis=1).astype(int)
+    faces = face.get('vertex_indices', face.get('vertex_index', []))
+    facecolors = np.tile(DEFAULT_FACE_COLOR, (len(faces), 1))
+    if 'red' in face:
+        facecolors = np.stack((face['red'], face['green'], face['blue']), axis=1).astype(int)
+    return nodes, nodecolors, pad_faces(list(faces)), facecolors
+
+def read_ply_ascii(f, elements):
+    '''
+    Read the elements of an ascii ply body, one line per item.
+    '''
+    data = {}
+    for name, count, properties in elements:
+        rows = [f.readline().split() for _ in range(count)]
+        columns = {}
+        if len(set(map(len, rows))) <= 1:
+            # every row is the same length (no lists, or all triangles or
+            # all quads), parse it all at once
+            values = np.array(rows, dtype=float).reshape(count, -1)
+            i = 0
+            for prop in properties:
+                if prop[1] == 'list':
+                    n = int(values[0,i]) if count else 0
+                    columns[prop[0]] = values[:,i+1:i+1+n].astype(prop[3])
+                    i += 1 + n
+                else:
+                    columns[prop[0]] = values[:,i].astype(prop[1])
+                    i += 1
+        else:
+            for prop in properties:
+                columns[prop[0]] = []
+            for row in rows:
+                i = 0
+                for prop in properties:
+                    if prop[1] == 'list':
+                        n = int(row[i])
+                        columns[prop[0]].append([int(v) for v in row[i+1:i+1+n]])
+                        i += 1 + n
+                    else:
+                        columns[prop[0]].append(float(row[i]))
+                        i += 1
+            for prop in properties:
+                if prop[1] != 'list':
+                    columns[prop[0]] = np.array(columns[prop[0]]).astype(prop[1])
+        data[name] = columns
+    return data
+
+def read_ply_binary(f, elements, endian):
+    '''
+    Read the elements of a binary ply body. Elements without lists, and
+    lists that are the same length for every item (all triangles or all
+    quads), are read in one go.
+    '''
+    body = f.read()
+    offset = 0
+    data = {}
+    for name, count, properties in elements:
+        lists = [p for p in properties if p[1] == 'list']
+        if lists:
+            # guess every list is as long as the first one, then check
+            dtype, length = [], None
+            for prop in properties:
+                if prop[1] == 'list':
+                    if length is None:
+                        length = int(np.frombuffer(body, endian + prop[2], 1, offset)[0])
+                    dtype += [(prop[0] + '_count', endian + prop[2]),
+                              (prop[0], endian + prop[3], (length,))]
+                else:
+                    dtype.append((prop[0], endian + prop[1]))
+            dtype = np.dtype(dtype)
+            items = np.frombuffer(body, dtype, count, offset) if offset + dtype.itemsize*count <= len(body) else None
+            if items is not None and all((items[p[0] + '_count'] == length).all() for p in lists):
+                data[name] = {p[0]: items[p[0]] for p in properties}
+                offset += dtype.itemsize * count
+                continue
+            # lists of different lengths, read item by item
+            columns = {p[0]: [] for p in properties}
+            for _ in range(count):
+                for prop in properties:
+                    if prop[1] == 'list':
+                        n = int(np.frombuffer(body, endian + prop[2], 1, offset)[0])
+                        offset += np.dtype(prop[2]).itemsize
+                        columns[prop[0]].append(np.frombuffer(body, endian + prop[3], n, offset).tolist())
+                        offset += n * np.dtype(prop[3]).itemsize
+                    else:
+                        columns[prop[0]].append(np.frombuffer(body, endian + prop[1], 1, offset)[0])
+                        offset += np.dtype(prop[1]).itemsize
+            data[name] = {k: v if any(p[0] == k and p[1] == 'list' for p in properties) else np.array(v)
+                          for k, v in columns.items()}
+        else:
+            dtype = np.dtype([(prop[0], endian + prop[1]) for prop in properties])
+            items = np.frombuffer(body, dtype, count, offset)
+            data[name] = {prop[0]: items[prop[0]] for prop in properties}
+            offset += dtype.itemsize * count
+    return data
@@ -0,0 +1,163 @@
+'''
+Timers, counters and throughput of a run.
+
+Projector.run times every stage of every batch (transform, labels,
+render, save, ...) and can write a json line per batch to a metrics file,
+with frames/s, the ETA and the memory high-water mark. It can also run
+cProfile over a window of frames. Worker processes write their own lines,
+tagged with their shard.
+
+    python projector.py -r numpy -d -p --metrics data/metrics.jsonl --profile 2000:3000
+'''
+
+import sys
+import json
+import time
+import cProfile
+import threading
+import contextlib
+import collections
+try:
+    import resource
+except ImportError:
+    # not on windows
+    resource = None
+
+class RunMetrics(object):
+    '''
+    Per stage timers and counters for one process of a run.
+    '''
+    def __init__(self, total, path=None, shard=None, profile=None, profile_path=None):
+        '''
+        Args:
+            :param total: (int) how many frames this process renders, for the ETA
+            :param path: (str) a file to append a json line to every batch, None for none
+            :param shard: (int) the shard of this process, tags every line
+            :param profile: (tuple) start, stop frames to run cProfile over, None for none
+            :param profile_path: (str) where to dump the profile
+        '''
+        self.total = total
+        self.path = path
+        self.shard = shard
+        self.profile_frames = profile
+        self.profile_path = profile_path
+        self.profiler = None
+        self.start = time.perf_counter()
+        self.frames = 0
+        self.seconds = collections.defaultdict(float)
+        self.calls = collections.Counter()
+        # images are saved on writer threads
+        self.lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        '''
+        Time a stage, the time adds up over every call.
+        '''
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            with self.lock:
+                self.seconds[name] += seconds
+                self.calls[name] += 1
+
+    def timed(self, name, fn):
+        '''
+        Wrap fn so every call of it is timed as a stage, for calls on other threads.
+        '''
+        def call(*args, **kwargs):
+            with self.stage(name):
+                return fn(*args, **kwargs)
+        return call
+
+    def count(self, frames):
+        '''
+        Count frames as done.
+        '''
+        self.frames += frames
+
+    def fps(self):
+        '''
+        Return the frames per second so far.
+        '''
+        elapsed = time.perf_counter() - self.start
+        return self.frames / elapsed if elapsed else 0.
+
+    def eta(self):
+        '''
+        Return the seconds until every frame is done, None if we don't know yet.
+        '''
+        fps = self.fps()
+        return (self.total - self.frames) / fps if fps else None
+
+    def report(self):
+        '''
+        Return everything measured so far as a dict.
+        '''
+        elapsed = time.perf_counter() - self.start
+        with self.lock:
+            stages = {name: {'seconds': seconds, 'calls': self.calls[name],
+                             'share': seconds / elapsed if elapsed else 0.}
+                      for name, seconds in self.seconds.items()}
+        return {
+            'time': time.time(),
+            'shard': self.shard,
+            'frames': self.frames,
+            'total': self.total,
+            'elapsed': elapsed,
+            'fps': self.fps(),
+            'eta': self.eta(),
+            'max_rss': max_rss(),
+            'stages': stages,
+        }
+
+    def log(self):
+        '''
+        Append the report to the metrics file, if we have one.
+        '''
+        if self.path is None:
+            return
+        # one short write per line so processes can share the file
+        with open(self.path, 'a') as f:
+            f.write(json.dumps(self.report()) + '\n')
+
+    def profile(self, frame, frames=1):
+        '''
+        Start or stop the profiler, called before every batch.
+        Args:
+            :param frame: (int) the first frame of the batch
+            :param frames: (int) how many frames the batch has, a batch that
+            overlaps the window at all is profiled
+        '''
+        if self.profile_frames is None:
+            return
+        start, stop = self.profile_frames
+        if self.profiler is None and frame < stop and frame + frames > start:
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        elif self.profiler is not None and frame >= stop:
+            self.close()
+
+    def close(self):
+        '''
+        Stop the profiler and save what it found.
+        '''
+        if self.profiler is not None:
+            self.profiler.disable()
+            self.profiler.dump_stats(self.profile_path)
+            print(f'saved the profile to {self.profile_path}')
+            self.profiler = None
+            # only profile one window
+            self.profile_frames = None
+
+def max_rss():
+    '''
+    Return the memory high-water mark of this process in bytes, None if we can't tell.
+    '''
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # linux counts in kilobytes, macos in bytes
+    return rss if sys.platform == 'darwin' else rss * 1024
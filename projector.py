@@ -9,31 +9,58 @@ Download the generated data here:
 
 import os
 import sys
-import pygame
+import json
 import argparse
 import datetime
+import multiprocessing
 import numpy as np
 import wireframe as wf
+from PIL import Image
+from renderer import PygameRenderer, NumpyRenderer
+from img_converter import parse_target
+from shards import ShardWriter, create_shards
+from validate import validate_labels, print_report
+from samplers import EulerGridSampler, create_sampler
+from dedup import DedupIndex
+from metrics import RunMetrics
+from meshes import load_mesh
+from writer import WriteQueue
 
 class Projector(object):
     '''
-    Makes 2D projections of 3d wireframes on a pygame screen.
+    Makes 2D projections of 3d wireframes on a pygame screen, or
+    headless with the numpy renderer.
     '''
-    def __init__(self, width, height, fps, save_data, save_pos, step_size):
-        # setup pygame
+    def __init__(self, width, height, fps, save_data, save_pos, step_size, renderer='pygame'):
         self.width = width
         self.height = height
-        pygame.init()
-        self.screen = pygame.display.set_mode((width, height))
-        pygame.display.set_caption('Wireframe Display')
+        # which renderer to draw with, pygame opens a window
+        # numpy needs no display at all
+        self.renderer = renderer
+        if renderer == 'pygame':
+            # setup pygame, only imported when we draw with it
+            import pygame
+            pygame.init()
+            self.screen = pygame.display.set_mode((width, height))
+            pygame.display.set_caption('Wireframe Display')
+        else:
+            self.screen = None
         self.background = (10,10,50)
         # where we will store our cube
         self.wireframes = {}
+        # where every wireframe is centered
+        self.centers = {}
         # whether to display different parts
         self.display_nodes = True
         self.display_faces = True
         # how big the 'points'/'nodes' are in our cube
         self.node_radius = 4
+        # the (width, height) to render the images at, None for our size,
+        # smaller sizes are drawn straight at that size by the numpy
+        # renderer, and how many points per pixel along each axis it
+        # averages to anti-alias the edges, 1 for hard edges
+        self.render_size = None
+        self.antialias = 1
         # to slow down the viewer
         # default=None for testing set to 5, it will slow down generation a lot
         self.fps = fps
@@ -43,152 +70,423 @@ class Projector(object):
         self.save_data = save_data
         self.save_pos = save_pos
         self.step_size = step_size
+        # the poses to render, a sampler from samplers.py, None
+        # for the euler grid of step_size
+        self.sampler = None
+        # how many frames to rotate at once
+        self.batch_size = 1000
+        # how many processes render frames
+        self.workers = 1
+        # the type the labels are stored as, float32 halves the file size
+        self.label_dtype = np.float64
+        # pick up the last run where it stopped
+        self.resume = False
+        # where to save images, a list of (folder, size, format, ext, quality)
+        # like img_converter's targets, the default is full size bitmaps
+        self.outputs = [parse_target('imgs_bmp::bmp')]
+        # how many threads encode and write images and labels, and how
+        # many writes can wait for them before the run loop blocks
+        self.writer_threads = 4
+        self.write_queue_size = 1000
+        # a folder to pack images and labels into shards, see shards.py,
+        # how many frames per shard, and the (width, height) of the images
+        # in the shards, None for our size
+        self.shard_folder = None
+        self.shard_frames = 10000
+        self.shard_size = None
+        self.shard_writer = None
+        # skip drawing and saving frames that look the same as an earlier
+        # frame, see dedup.py, how close node positions have to be to count
+        # as the same, and whether to compare the rendered images too
+        self.dedup = False
+        self.dedup_quantum = 0.5
+        self.dedup_images = False
+        # the .npy file with the canonical frame of every frame
+        self.dedup_file = None
+        # a file to append the timers, frames/s, ETA and memory of every
+        # batch to as json lines, see metrics.py, and a (start, stop)
+        # window of frames to run cProfile over
+        self.metrics_file = None
+        self.profile_frames = None
 
-    def add_wireframe(self, name, wireframe):
+    def add_wireframe(self, name, wireframe, center=None):
         '''
         Add a wireframe to our scene.
+        Args:
+            :param name: (str) the name of the wireframe, names its label file
+            :param wireframe: (Wireframe) the wireframe
+            :param center: (tuple) x,y,z where the wireframe is centered in every
+            frame, defaults to the middle of the screen
         '''
         self.wireframes[name] = wireframe
+        self.centers[name] = center
 
-    def run(self, test_npy=False):
+    def run(self):
         '''
-        Run pygame and dispaly our wireframes
+        Run the renderer and dispaly our wireframes
         '''
-        # clock to slow thigns down a bit to
-        # get better images
-        clockobject = pygame.time.Clock()
-        running = True
-        seq_step = 0
         # create our set of rotations
-        if test_npy:
-            data = np.load(test_npy)
-            # for all nodes get the positions
-            pos = data[:,:,:3]
-            # for all nodes get the roations
-            # rotation si the same across nodes
-            # so we get the first one
-            seq = data[:,:,3]
-        else:
-            seq = self.create_rotation_sequence(self.step_size)
+        seq = self.pose_sampler()
         # store a numpy array for every wireframe
         # some may differ. this will allow us to
         # create entire scenes and learn them later
         # if we want to do that
         if self.limit_samples:
-            row_count = self.limit_samples
+            row_count = min(self.limit_samples, len(seq))
         else:
             row_count = len(seq)
 
-        # get the only wireframe (the cube)
-        # and initialize a numpy array
-        # every row in rotaitons_positions
-        # is a frame, then there is a dimension
-        # for nodes, then 6 columns, 3 for XYZ coords,
-        # 3 for XYZ rotations in radians
-        key = list(self.wireframes.keys())[0]
-        wireframe = self.wireframes[key]
-        rotation_positions = np.zeros((row_count, wireframe.nodes.shape[0],6))
-
-        while running:
-            if self.fps: clockobject.tick(self.fps)
-            for event in pygame.event.get():
-                if event.type == pygame.QUIT:
-                    running = False
-            if test_npy:
-                for radians, axis  in zip(tuple(seq[seq_step]), ('x','y','z')):
-                    self.rotate_all(axis, radians)
-                # set the cube nodes the stored positions
-                cube.nodes = pos[seq_step]
+        # stream the labels straight into one .npy file per wireframe
+        # as they are made instead of keeping them all in memory
+        labels = None
+        if self.resume:
+            # pick up the label files and shards of the run we are resuming
+            manifest = self.load_manifest(row_count)
+            shards = manifest['shards']
+            if manifest['label_files'] is not None:
+                labels = {name: np.lib.format.open_memmap(label_file, mode='r+')
+                          for name, label_file in manifest['label_files'].items()}
+            self.dedup_file = manifest.get('dedup_file')
+        else:
+            if self.save_pos:
+                labels = self.create_label_files(row_count)
+            # split the frames into one contiguous shard per worker, shards
+            # keep their global frame index so the images and labels come
+            # out exactly like a serial run
+            bounds = np.linspace(0, row_count, self.workers + 1).astype(int)
+            shards = [[int(start), int(stop)] for start, stop in zip(bounds[:-1], bounds[1:])]
+            if self.dedup:
+                self.dedup_file = self.create_dedup_file(seq[:row_count])
+            self.save_manifest(row_count, shards, labels)
+
+        # pack images and labels into shards as well as (or instead of) files
+        if self.shard_folder is not None:
+            key = list(self.wireframes.keys())[0]
+            if self.resume:
+                self.shard_writer = ShardWriter(self.shard_folder, key)
             else:
-                # go to the next rotation, recenter our wireframe
-                for radians, axis in zip(seq[seq_step] , ('x','y','z')):
-                    self.rotate_all(axis, radians)
-                cube.center_wireframe((self.width//2, self.width//2, 0))
+                width, height = self.shard_size or self.render_size or (self.width, self.height)
+                # the labels of every wireframe are packed along the nodes
+                self.shard_writer = create_shards(self.shard_folder, key, row_count,
+                                                  self.shard_frames, (height, width, 3),
+                                                  (sum(self.wireframe_nodes().values()), 6),
+                                                  self.label_dtype, self.wireframe_nodes(),
+                                                  None if self.dedup_file is None else np.load(self.dedup_file))
+
+        # every shard starts at its first frame that isn't checkpointed yet
+        label_files = None
+        if labels is not None:
+            label_files = {name: label.filename for name, label in labels.items()}
+        tasks = []
+        for start, stop in shards:
+            done = self.load_checkpoint(start)
+            if done < stop:
+                tasks.append((self, seq[done:stop], done, label_files, start))
+        if self.workers > 1:
+            # every worker writes its rows of the label files itself
+            with multiprocessing.Pool(self.workers) as pool:
+                pool.starmap(render_shard, tasks)
+                # let the workers exit by themselves, leaving the with block
+                # terminates them, and workers forked after pygame.init()
+                # inherit SDL's SIGTERM handler and never die
+                pool.close()
+                pool.join()
+        else:
+            for _, shard_seq, done, _, start in tasks:
+                if not self.render_frames(shard_seq, done, labels=labels, shard=start):
+                    break
+
+        print('Stopping run.')
+        # --dedup-images changed the canonical frames while rendering
+        if self.shard_writer is not None and self.dedup_file is not None:
+            self.shard_writer.write_dedup(np.load(self.dedup_file))
+        # once we exit the run loop make sure the positions are on disk
+        if labels is not None:
+            for label in labels.values():
+                label.flush()
+                print(f'saved labels to {label.filename}')
+        if self.screen is not None:
+            import pygame
+            pygame.quit()
+
+    def render_frames(self, seq, offset=0, labels=None, shard=None):
+        '''
+        Render (and save) a run of frames and compute their labels.
+        Args:
+            :param seq: (list) x,y,z rotations in radians, one per frame
+            :param offset: (int) the global index of the first frame in seq,
+            used to number the images
+            :param labels: (dict) wireframe name -> the FRAMES x N x 6 label array
+            (usually memmaps from create_label_files) to write the labels of these
+            frames into, the rows are global frame indices, None to not save labels
+            :param shard: (int) the first frame of the shard these frames belong to,
+            if given a checkpoint is written for the shard after every batch
+        Returns:
+            (bool) False if the pygame window was closed before we finished
+        '''
+        renderer = self.create_renderer()
+        # get the first wireframe (the cube), it names our files
+        key = list(self.wireframes.keys())[0]
+        canonical = None
+        if self.dedup_file is not None:
+            canonical = np.load(self.dedup_file, mmap_mode='r+')
+            # images are only compared with the other images of this call,
+            # one shard, since the last resume
+            index = DedupIndex(list(self.wireframes.values()), self.dedup_quantum)
+        # images and labels are written in the background, when too many
+        # writes wait the loop blocks until the disk catches up, a batch
+        # is only checkpointed once all its writes are on disk
+        writer = WriteQueue(self.writer_threads, self.write_queue_size)
+        pending = ([], None)
+        metrics = RunMetrics(len(seq), self.metrics_file, shard, self.profile_frames,
+                             f'data/{key}-profile-{shard or 0}.prof')
+        # open the shards here once, not on every writer thread
+        if self.shard_writer is not None: self.shard_writer.open_shards()
+        # the writes are timed on the writer threads
+        write_labels = metrics.timed('label_write', write_rows)
+        save_image = metrics.timed('save', self.save_image)
+        if self.shard_writer is not None:
+            write_shard_labels = metrics.timed('shard_write', self.shard_writer.write_labels)
+            write_shard_images = metrics.timed('shard_write', self.shard_writer.write_images)
 
-            # print every 100 steps the progress
-            if not seq_step % 100:
+        try:
+            for seq_step in range(0, len(seq), self.batch_size):
+                batch_seq = seq[seq_step:seq_step+self.batch_size]
+                metrics.profile(offset + seq_step, len(batch_seq))
+                # rotate and recenter a whole batch of frames at once
+                with metrics.stage('transform'):
+                    batch = self.transform_all_batch(batch_seq)
+                start = offset + seq_step
+                futures = []
+                with metrics.stage('labels'):
+                    if labels is not None:
+                        for name, label in labels.items():
+                            futures.append(writer.submit(write_labels, label, start,
+                                                         self.create_labels(batch[name], batch_seq)))
+                    if self.shard_writer is not None:
+                        # all the wireframes packed along the nodes
+                        packed = np.concatenate(list(batch.values()), axis=1)
+                        futures.append(writer.submit(write_shard_labels, start,
+                                                     self.create_labels(packed, batch_seq)))
+
+                # print every batch the progress
                 prog = round(seq_step/len(seq)*100, 2)
                 print(f'progress: {prog}%')
-                print(f'step: {seq_step}')
-                print(f'one node: {self.wireframes["cube1"].nodes[0]}')
+                print(f'step: {offset+seq_step}')
+                print(f'one node: {batch[key][0,0]}')
+                if metrics.eta() is not None:
+                    print(f'{metrics.fps():.1f} frames/s, {metrics.eta():.0f}s left')
 
-            # get the shapes of the rotations and the wireframe node positions consistent
-            # so they can both be inserted into the same np array
-            if self.save_pos:
-                for _, wireframe in self.wireframes.items():
-                    # seq step is already a 3 element array, so tile takes NX1
-                    rotation_array = np.tile(np.array(seq[seq_step]), (wireframe.nodes.shape[0],1))
-                    # combine the rotations and positions
-                    rotation_positions[seq_step] = np.hstack((wireframe.nodes[:, :3], rotation_array))
-
-            # keep track of which rotation we are on, if we are on
-            # the right one, leave the run loop
-            seq_step += 1
-            if seq_step == len(seq) or seq_step == self.limit_samples:
-                print(seq_step, len(seq))
-                print('Stopping run.')
-                running = False
-
-            # update the display of our cube
-            self.display()
-            pygame.display.update()
-            # save a picture, then reset the cube to its
-            # original positions/rotations
-            if self.save_data: self.save_projection(key, str(seq_step))
-            cube.reset_nodes()
-
-        # once we exit the run loop save the positions
-        if self.save_pos: self.save_wireframe_data(rotation_positions)
-        pygame.quit()
+                # draw the whole batch then save a picture of every frame,
+                # images are numbered from 1 like the frames, when resuming
+                # we only draw the frames whose image isn't on disk yet
+                indices = [str(offset+seq_step+i+1) for i in range(len(batch_seq))]
+                todo = np.arange(len(indices))
+                frames = offset + seq_step + todo
+                if canonical is not None:
+                    # frames that look like an earlier frame are skipped
+                    todo = todo[canonical[frames] == frames]
+                if self.save_data and self.resume:
+                    with metrics.stage('resume_check'):
+                        todo = np.array([i for i in todo
+                                         if not self.image_saved(key, indices[i])], dtype=int)
+                with metrics.stage('render'):
+                    images = renderer.render([self.wireframes[name] for name in batch],
+                                             [nodes[todo] for nodes in batch.values()])
+                if canonical is not None and self.dedup_images:
+                    # and so are the ones whose image matches an earlier one
+                    with metrics.stage('dedup_images'):
+                        todo = todo[:len(images)]
+                        same = index.add_images(frames[todo], images)
+                        canonical[frames[todo]] = same
+                        keep = same == frames[todo]
+                        todo, images = todo[keep], images[keep]
+                # blocks while the queue is full
+                with metrics.stage('queue_full'):
+                    if self.save_data:
+                        futures += [writer.submit(save_image, image, key, indices[i])
+                                    for i, image in zip(todo, images)]
+                    if self.shard_writer is not None:
+                        futures.append(writer.submit(write_shard_images, offset+seq_step+todo, images))
+                metrics.count(len(batch_seq))
+                # the pygame window was closed
+                if not renderer.running:
+                    break
+                # while this batch is written wait for the last one
+                self.finish_batch(*pending, labels, shard, canonical, metrics)
+                pending = (futures, offset+seq_step+len(batch_seq))
+            self.finish_batch(*pending, labels, shard, canonical, metrics)
+        finally:
+            # every write is on disk before we return, a failed one raises
+            writer.close()
+            metrics.close()
+        return renderer.running
+
+    def finish_batch(self, futures, done, labels=None, shard=None, canonical=None, metrics=None):
+        '''
+        Wait for the images and labels of a batch to be written, then flush
+        them and checkpoint the shard, everything before done is on disk.
+        Args:
+            :param futures: (list) the futures of the batch's writes
+            :param done: (int) the first frame after the batch, None for no batch
+            :param labels: (dict) wireframe name -> label memmap
+            :param shard: (int) the first frame of the shard
+            :param canonical: (numpy memmap) the canonical frame of every frame
+            :param metrics: (RunMetrics) the metrics of the run, logged after the batch
+        '''
+        if metrics is None:
+            metrics = RunMetrics(0)
+        with metrics.stage('wait'):
+            for future in futures:
+                # raises if the write failed
+                future.result()
+        if done is None:
+            return
+        with metrics.stage('flush'):
+            if labels is not None:
+                for label in labels.values():
+                    label.flush()
+            if self.shard_writer is not None: self.shard_writer.flush()
+            if canonical is not None: canonical.flush()
+            if shard is not None:
+                self.save_checkpoint(shard, done)
+        metrics.log()
+
+    def save_manifest(self, row_count, shards, labels):
+        '''
+        Save the manifest of a run, everything we need to resume it.
+        Args:
+            :param row_count: (int) the number of frames in the run
+            :param shards: (list) [start, stop] frames of every shard
+            :param labels: (dict) wireframe name -> label memmap, None if not saving labels
+        '''
+        # a new run starts from scratch
+        for start, _ in shards:
+            if os.path.exists(self.checkpoint_path(start)):
+                os.remove(self.checkpoint_path(start))
+        manifest = {
+            'sampler': self.pose_sampler().describe(),
+            'row_count': row_count,
+            'shards': shards,
+            'label_files': None if labels is None else {name: label.filename for name, label in labels.items()},
+            'label_dtype': np.dtype(self.label_dtype).name,
+            'wireframes': self.describe_wireframes(),
+            'dedup_file': self.dedup_file,
+        }
+        write_json(self.manifest_path(), manifest)
+
+    def load_manifest(self, row_count):
+        '''
+        Load the manifest of the run we are resuming and make sure
+        it was made with the same settings we have now.
+        Args:
+            :param row_count: (int) the number of frames in this run
+        Returns:
+            (dict) the manifest
+        '''
+        with open(self.manifest_path()) as f:
+            manifest = json.load(f)
+        current = {
+            'sampler': self.pose_sampler().describe(),
+            'row_count': row_count,
+            'label_dtype': np.dtype(self.label_dtype).name,
+            'wireframes': self.describe_wireframes(),
+        }
+        for k, v in current.items():
+            if manifest.get(k) != v:
+                raise ValueError(f'Can\'t resume, {k} is {v} but the run in {self.manifest_path()} used {manifest.get(k)}.')
+        if self.save_pos and manifest.get('label_files') is None:
+            raise ValueError(f'Can\'t resume, the run in {self.manifest_path()} did not save positions.')
+        if self.dedup and manifest.get('dedup_file') is None:
+            raise ValueError(f'Can\'t resume, the run in {self.manifest_path()} did not dedup its frames.')
+        return manifest
+
+    def save_checkpoint(self, shard, done):
+        '''
+        Record that a shard has every frame before done on disk.
+        Args:
+            :param shard: (int) the first frame of the shard
+            :param done: (int) the first frame that isn't done yet
+        '''
+        write_json(self.checkpoint_path(shard), {'shard': shard, 'done': done})
+
+    def load_checkpoint(self, shard):
+        '''
+        Return the first frame of a shard that isn't done yet.
+        Args:
+            :param shard: (int) the first frame of the shard
+        '''
+        if not os.path.exists(self.checkpoint_path(shard)):
+            return shard
+        with open(self.checkpoint_path(shard)) as f:
+            return json.load(f)['done']
+
+    def manifest_path(self):
+        '''
+        Return the path of the run manifest, named after the first wireframe.
+        '''
+        name = list(self.wireframes.keys())[0]
+        return f'data/{name}-run.json'
+
+    def checkpoint_path(self, shard):
+        '''
+        Return the path of the checkpoint for the shard starting at frame shard.
+        '''
+        return self.manifest_path().replace('.json', f'-{shard}.json')
+
+    def describe_wireframes(self):
+        '''
+        Return the definition of every wireframe as plain lists, so runs made
+        with different wireframes can be told apart.
+        '''
+        return {name: {'nodes': wireframe.nodes_initial[:,:3].tolist(),
+                       'faces': np.asarray(wireframe.faces).tolist(),
+                       'facecolors': np.asarray(wireframe.facecolors).tolist(),
+                       'nodecolors': np.asarray(wireframe.nodecolors).tolist(),
+                       'center': list(self.centers[name]) if self.centers.get(name) else None}
+                for name, wireframe in self.wireframes.items()}
+
+    def __getstate__(self):
+        '''
+        The pygame screen can't be sent to worker processes, workers
+        draw on their own offscreen surface instead.
+        '''
+        state = self.__dict__.copy()
+        state['screen'] = None
+        return state
+
+    def create_renderer(self, size=None):
+        '''
+        Create the renderer for our current settings.
+        Args:
+            :param size: (tuple) width, height to render at, defaults to the render size
+        '''
+        kwargs = dict(background=self.background,
+                      node_radius=self.node_radius,
+                      display_nodes=self.display_nodes,
+                      display_faces=self.display_faces)
+        width, height = size or self.render_size or (self.width, self.height)
+        if self.renderer == 'pygame':
+            if (width, height) != (self.width, self.height) or self.antialias != 1:
+                raise ValueError('Rendering at another size or anti-aliasing needs the numpy renderer.')
+            return PygameRenderer(self.width, self.height, screen=self.screen, fps=self.fps, **kwargs)
+        elif self.renderer == 'numpy':
+            if width * self.height != height * self.width:
+                raise ValueError(f'The render size {width}x{height} has to have the same shape as {self.width}x{self.height}.')
+            return NumpyRenderer(width, height, supersample=self.antialias,
+                                 scale=width / self.width, **kwargs)
+        raise ValueError(f'Unknown renderer {self.renderer}, use pygame or numpy.')
 
     def display(self):
         '''
         Draw the wireframes on the pygame screen.
         '''
-        self.screen.fill(self.background)
-        for wireframe in self.wireframes.values():
-            nodes = wireframe.nodes
-            if self.display_faces:
-                for face_color in zip(wireframe.sorted_faces()):
-                    color = face_color[0][1]
-                    face = face_color[0][0]
-                    vector1 = (nodes[face[1]] - nodes[face[0]])[:3]
-                    vector2 = (nodes[face[2]] - nodes[face[0]])[:3]
-
-                    # see this https://www.mathsisfun.com/algebra/vectors-cross-product.html
-                    normal = np.cross(vector1, vector2)
-                    # now multiply it by the negative z axis to
-                    # see that the normal points towards us in some way
-                    # we only want to display those graphics
-                    # (because thats what we 'see')
-                    towards_us = np.dot(normal, np.array([0,0,-1]))
-                    # if we dont make it a least greater than 10
-                    # then like very margianl values show dots,
-                    # and you see the dots but no side, this is
-                    # jsut a rough value. works nicely.
-                    if sum(normal) == 0:
-                        print(nodes[face[2]], nodes[face[1]], nodes[face[0]])
-                        sys.exit(0)
-                    if towards_us > 10:
-
-                        towardus_nodes_colors = []
-                        poly_nodes = []
-                        for node in face:
-                            poly_nodes.append((nodes[node,0], nodes[node,1]))
-                            towardus_nodes_colors.append((nodes[node], wireframe.nodecolors[node]))
-                        # draw all our faces
-                        pygame.draw.polygon(self.screen,
-                                            color,
-                                            poly_nodes,
-                                            0)
-                        if self.display_nodes:
-                            for node, color in towardus_nodes_colors:
-                                pygame.draw.circle(self.screen,
-                                                color,
-                                                (int(node[0]), int(node[1])),
-                                                self.node_radius,
-                                                0
-                                                )
+        PygameRenderer(self.width, self.height,
+                       screen=self.screen,
+                       background=self.background,
+                       node_radius=self.node_radius,
+                       display_nodes=self.display_nodes,
+                       display_faces=self.display_faces).draw(self.wireframes.values())
 
     def translate_all(self, vector):
         '''
@@ -207,22 +505,79 @@ class Projector(object):
             :axis: The axis on which to rotate x, y, z
             :param radians: The amount in radians to rotate by
         '''
-        rotate_func_name = 'create_rot_' + axis
-        rotation_matrix = getattr(wf, rotate_func_name)(radians)
+        rotation_matrix = wf.rotation_cache.rotation(axis, radians)
         for _,wireframe in self.wireframes.items():
             wireframe.transform(rotation_matrix)
 
+    def transform_all_batch(self, rotations):
+        '''
+        Rotate and recenter all wireframes for a batch of rotations at once,
+        the nodes of every wireframe are transformed together in one array.
+        Args:
+            :param rotations: (list) x,y,z rotations in radians, one per frame
+        Returns:
+            (dict) wireframe name -> F x N x 4 numpy array of node positions
+        '''
+        screen_center = (self.width//2, self.width//2, 0)
+        centers = [self.centers.get(name) or screen_center for name in self.wireframes]
+        nodes = wf.transform_batch_packed(list(self.wireframes.values()), rotations, centers)
+        return dict(zip(self.wireframes.keys(), nodes))
+
+    def wireframe_nodes(self):
+        '''
+        Return the number of nodes of every wireframe, in order.
+        '''
+        return {name: wireframe.nodes.shape[0] for name, wireframe in self.wireframes.items()}
+
+    def create_labels(self, nodes, rotations):
+        '''
+        Combine node positions and rotations into rows of labels.
+        Args:
+            :param nodes: (numpy array) F x N x 4 node positions, F is frames
+            :param rotations: (list) x,y,z rotations in radians, one per frame
+        Returns:
+            (numpy array) F x N x 6, 3 for XYZ coords, 3 for XYZ rotations
+        '''
+        rotations = np.asarray(rotations, dtype=float).reshape(-1, 1, 3)
+        rotations = np.broadcast_to(rotations, nodes.shape[:2] + (3,))
+        return np.concatenate((nodes[:,:,:3], rotations), axis=2)
+
+    def compute_labels(self, seq, out=None):
+        '''
+        Compute the labels for every rotation in seq without rendering anything.
+        Args:
+            :param seq: (list) x,y,z rotations in radians, one per frame
+            :param out: (dict) optional wireframe name -> F x N x 6 array to write
+            the labels into, like the memmaps from create_label_files
+        Returns:
+            (dict) wireframe name -> F x N x 6 labels, the same arrays run saves
+        '''
+        if out is None:
+            out = {name: np.zeros((len(seq), nodes, 6), dtype=self.label_dtype)
+                   for name, nodes in self.wireframe_nodes().items()}
+        for start in range(0, len(seq), self.batch_size):
+            batch_seq = seq[start:start+self.batch_size]
+            batch = self.transform_all_batch(batch_seq)
+            for name, labels in out.items():
+                labels[start:start+len(batch_seq)] = self.create_labels(batch[name], batch_seq)
+        return out
+
+    def pose_sampler(self):
+        '''
+        Return the sampler of the poses to render.
+        '''
+        if self.sampler is not None:
+            return self.sampler
+        return EulerGridSampler(self.step_size)
+
     def create_rotation_sequence(self, step_size):
         '''
         Autorotates through all possible combinations of x,y,z
         rotations and takes a screenshot.
+        Returns:
+            (numpy array) F x 3 x,y,z rotations in radians
         '''
-        rotations = []
-        for rot_x in np.arange(0, 6.3, step_size):
-            for rot_y in np.arange(0, 6.3, step_size):
-                for rot_z in np.arange(0, 6.3, step_size):
-                    rotations.append((rot_x,rot_y,rot_z))
-        return rotations
+        return EulerGridSampler(step_size)[:]
 
     def save_wireframe_data(self, rotation_positions):
         '''
@@ -231,9 +586,55 @@ class Projector(object):
             :param rotation_positions: (numpy array) N x Z x 6, where N is
             frames, Z is nodes, 6 is XYZ coordiantes and XYZ roations
         '''
-        name = list(self.wireframes.keys())[0]
+        np.save(self.label_path(), rotation_positions)
+
+    def create_label_files(self, row_count):
+        '''
+        Create one label file per wireframe on disk and return them as memory
+        mapped arrays, rows written to them go straight to disk so memory stays
+        the same however many frames there are. They open with plain np.load.
+        Args:
+            :param row_count: (int) the number of frames
+        Returns:
+            (dict) wireframe name -> row_count x N x 6 memmap of self.label_dtype
+        '''
+        return {name: np.lib.format.open_memmap(self.label_path(name), mode='w+',
+                                                dtype=self.label_dtype,
+                                                shape=(row_count, nodes, 6))
+                for name, nodes in self.wireframe_nodes().items()}
+
+    def create_dedup_file(self, seq):
+        '''
+        Find the canonical frame of every frame from its pose, the first
+        frame that looks the same, and save them to a .npy file.
+        Args:
+            :param seq: (list) x,y,z rotations in radians, one per frame
+        Returns:
+            (str) the path of the file
+        '''
+        key = list(self.wireframes.keys())[0]
+        dt = datetime.datetime.now().strftime('%Y-%m-%d-%H-%M-%S')
+        path = f'data/{key}-dedup-{dt}.npy'
+        canonical = np.lib.format.open_memmap(path, mode='w+', dtype=np.int64, shape=(len(seq),))
+        index = DedupIndex(list(self.wireframes.values()), self.dedup_quantum)
+        for start in range(0, len(seq), self.batch_size):
+            batch_seq = seq[start:start+self.batch_size]
+            batch = self.transform_all_batch(batch_seq)
+            frames = np.arange(start, start + len(batch_seq))
+            canonical[frames] = index.add_poses(frames, list(batch.values()))
+        canonical.flush()
+        duplicates = (canonical != np.arange(len(seq))).sum()
+        print(f'{duplicates} of {len(seq)} frames look like an earlier frame, saved to {path}')
+        return path
+
+    def label_path(self, name=None):
+        '''
+        Return a new path for a label file, named after the wireframe
+        (by default the first one).
+        '''
+        if name is None: name = list(self.wireframes.keys())[0]
         dt = datetime.datetime.now().strftime('%Y-%m-%d-%H-%M-%S')
-        np.save(f'data/{name}-{np.__version__}-{dt}.npy', rotation_positions)
+        return f'data/{name}-{np.__version__}-{dt}.npy'
 
     def save_projection(self, name, idx=datetime.datetime.now().strftime('%Y-%m-%d-%H-%M-%S')):
         '''
@@ -244,15 +645,127 @@ class Projector(object):
             is an external counter you pass in
             if you don't pass one in the datetime for right now is used.
         '''
+        import pygame
         pygame.image.save(self.screen, f'imgs_bmp/{name}_index_{idx}.bmp')
 
+    def save_image(self, image, name, idx):
+        '''
+        Saves a rendered image to every output, named like save_projection.
+        Args:
+            :param image: (numpy array) H x W x 3 uint8 image from the renderer
+            :param name: name to give to your image.
+            :param idx: an index value to pass in for naming your files
+        '''
+        img = Image.fromarray(image)
+        for out, size, format, ext, quality in self.outputs:
+            # images rendered at the output size are saved as they are
+            resized = img.resize(size) if size and size != img.size else img
+            # save to a temporary file first so a killed run never
+            # leaves a half written image behind
+            path = self.image_path(name, idx, out, ext)
+            resized.save(path + '.tmp', format=format, subsampling=0, quality=quality)
+            os.replace(path + '.tmp', path)
+
+    def image_saved(self, name, idx):
+        '''
+        Return whether the image for frame idx is in every output.
+        '''
+        # there is no telling which rows of a shard were written
+        if self.shard_writer is not None:
+            return False
+        return all(os.path.exists(self.image_path(name, idx, out, ext))
+                   for out, _, _, ext, _ in self.outputs)
+
+    def image_path(self, name, idx, out='imgs_bmp', ext='bmp'):
+        '''
+        Return the path of the image for frame idx.
+        '''
+        return f'{out}/{name}_index_{idx}.{ext}'
+
+def write_json(path, data):
+    '''
+    Write data to a json file, atomically so a crash never leaves a broken file.
+    Args:
+        :param path: (str) the file to write
+        :param data: (dict) the data to write
+    '''
+    with open(path + '.tmp', 'w') as f:
+        json.dump(data, f)
+    os.replace(path + '.tmp', path)
+
+def write_rows(array, start, rows):
+    '''
+    Write rows into an array (a label memmap) from its row start on.
+    '''
+    array[start:start+len(rows)] = rows
+
+def render_shard(projector, seq, offset, label_files=None, shard=None):
+    '''
+    Render one shard of frames in a worker process.
+    Args:
+        :param projector: (Projector) a copy of the projector with its wireframes
+        :param seq: (list) x,y,z rotations in radians for this shard
+        :param offset: (int) the global index of the first frame of the shard
+        :param label_files: (dict) wireframe name -> the .npy label file to write this shard's rows into
+        :param shard: (int) the first frame of the shard, for checkpoints
+    '''
+    labels = None
+    if label_files is not None:
+        labels = {name: np.lib.format.open_memmap(label_file, mode='r+')
+                  for name, label_file in label_files.items()}
+    projector.render_frames(seq, offset, labels=labels, shard=shard)
+
+def load_wireframes(meshes):
+    '''
+    Load the wireframes of mesh files, named after their files, or the cube
+    if there are none.
+    Args:
+        :param meshes: (list) .obj or .ply paths, None for the cube
+    Returns:
+        (dict) name -> Wireframe, in the order of the files
+    '''
+    if not meshes:
+        return {'cube1': wf.create_cube()}
+    wireframes = {}
+    for mesh in meshes:
+        stem = os.path.splitext(os.path.basename(mesh))[0]
+        # the same file twice still gets a label file each
+        name, copy = stem, 1
+        while name in wireframes:
+            copy += 1
+            name = f'{stem}{copy}'
+        wireframes[name] = load_mesh(mesh)
+    return wireframes
+
 def parse_args(args):
     p = argparse.ArgumentParser()
     p.add_argument('-f', '--fps', type=int, default=None, help='The frames per second of the generation process.')
     p.add_argument('-s', '--step-size', type=float, default=0.3, help='The step size for the rotations')
-    p.add_argument('-t', '--test-npy', type=str, help='Tests a numpy file to make sure it\'s good. This arg is the file to test.')
+    p.add_argument('--sampler', type=str, default='grid', choices=['grid', 'random', 'fibonacci', 'hopf'],
+                   help='How to pick the poses, the euler grid of the step size or evenly spread rotations.')
+    p.add_argument('-n', '--frames', type=int, default=10000, help='How many poses the random, fibonacci and hopf samplers make.')
+    p.add_argument('--seed', type=int, help='The seed of the random, fibonacci and hopf samplers.')
+    p.add_argument('-t', '--test-npy', type=str, help='Tests a numpy file to make sure it\'s good (see validate.py). This arg is the file to test.')
     p.add_argument('-d', '--data-save', action='store_true', help='Whether to save iamge data.')
     p.add_argument('-p', '--pos-save', action='store_true', help='Whether to save position/rotation array data.')
+    p.add_argument('-r', '--renderer', type=str, default='pygame', choices=['pygame', 'numpy'], help='Draw with pygame (opens a window) or numpy (headless).')
+    p.add_argument('-w', '--workers', type=int, default=1, help='How many processes to render with, the frames are split between them.')
+    p.add_argument('--float32', action='store_true', help='Store the position/rotation array as float32 instead of float64.')
+    p.add_argument('-o', '--output', type=parse_target, action='append', default=[],
+                   help='Save images to folder:WIDTHxHEIGHT:format[:quality] instead of full size bitmaps in imgs_bmp, can be given many times.')
+    p.add_argument('--shards', type=str, help='Also pack the images and labels into memory mappable shards in this folder.')
+    p.add_argument('--shard-frames', type=int, default=10000, help='How many frames go in one shard.')
+    p.add_argument('--shard-size', type=str, help='WIDTHxHEIGHT of the images in the shards, defaults to the render size.')
+    p.add_argument('--resume', action='store_true', help='Resume the last run from its first missing frame, same settings required.')
+    p.add_argument('--dedup', action='store_true', help='Skip frames whose nodes are in the same places as an earlier frame.')
+    p.add_argument('--dedup-images', action='store_true', help='With --dedup also skip saving frames whose image matches an earlier one of the same shard.')
+    p.add_argument('--dedup-quantum', type=float, default=0.5, help='How close in pixels nodes have to be to count as the same.')
+    p.add_argument('--metrics', type=str, help='Append the timers, frames/s, ETA and memory of every batch to this file as json lines.')
+    p.add_argument('--profile', type=str, help='START:STOP frames to run cProfile over, saved to data/.')
+    p.add_argument('--render-size', type=str, help='WIDTHxHEIGHT to render the images at (numpy renderer), instead of resizing 256x256 images.')
+    p.add_argument('--antialias', type=int, default=1, help='Anti-alias with this many points per pixel along each axis (numpy renderer), 4 is smooth.')
+    p.add_argument('-m', '--mesh', type=str, action='append', help='Render the wireframe in this .obj or .ply file instead of the cube, repeat it to render several in the same frames.')
+    p.add_argument('-l', '--labels-only', action='store_true', help='Only compute and save the position/rotation array data, render nothing.')
     return p.parse_args(args)
 
 if __name__ == '__main__':
@@ -262,24 +775,76 @@ if __name__ == '__main__':
     test = args['test_npy']
     save = args['data_save']
     save_pos = args['pos_save']
+    labels_only = args['labels_only']
+    renderer = args['renderer']
+    workers = args['workers']
+    float32 = args['float32']
+    resume = args['resume']
+    outputs = args['output']
+    shard_folder = args['shards']
+    shard_frames = args['shard_frames']
+    shard_size = args['shard_size']
+    sampler = args['sampler']
+    frames = args['frames']
+    seed = args['seed']
+    dedup = args['dedup']
+    dedup_images = args['dedup_images']
+    dedup_quantum = args['dedup_quantum']
+    metrics_file = args['metrics']
+    profile = args['profile']
+    meshes = args['mesh']
+    render_size = args['render_size']
+    antialias = args['antialias']
 
-    # this is the folder where our
+    wireframes = load_wireframes(meshes)
+    if test:
+        # check the positions against the rotations, nothing is rendered,
+        # label files are named after their wireframe
+        names = [name for name in wireframes if os.path.basename(test).startswith(f'{name}-')]
+        if len(wireframes) > 1 and not names:
+            sys.exit(f'{test} is not the label file of any of {", ".join(wireframes)}')
+        name = max(names, key=len) if names else list(wireframes)[0]
+        report = validate_labels(test, wireframes[name])
+        print_report(test, report)
+        sys.exit(0 if report['ok'] else 1)
+
+    # these are the folders where our
     # images are saved
-    if not os.path.exists('./imgs_bmp'):
-        os.mkdir('imgs_bmp')
-
-    p = Projector(256, 256, fps, save, save_pos, step)
-    cube_nodes = [[x,y,z] for x in (0,100) for y in (0,100) for z in (0,100)]
-    cube_nodes = np.array(cube_nodes)
-    cube_faces = [[0,1,3,2], [7,5,4,6], [4,5,1,0], [2,3,7,6], [0,2,6,4], [5,7,3,1]]
-    cube_faces = np.array(cube_faces)
-    cube_colors = [[255, 0, 0],[0,255,0],[0,0,255],[255,255,0],[255,0,255],[0,255,255]]
-    cube_colors = np.array(cube_colors)
-    cube_node_colors = [[0,255,0],[255,255,0],[0,255,255],[150,150,255],[255, 0, 0],[0,100,255],[255,200,255],[255,255,255]]
-    cube_node_colors = np.array(cube_node_colors)
-    cube = wf.Wireframe(cube_nodes, cube_node_colors, cube_faces, cube_colors)
-    p.add_wireframe('cube1', cube)
-    p.run(test_npy=test)
+    if not outputs and not shard_folder:
+        outputs = [parse_target('imgs_bmp::bmp')]
+    for output in outputs:
+        os.makedirs(output[0], exist_ok=True)
+    # this is the folder where our
+    # labels are saved
+    if not os.path.exists('./data'):
+        os.mkdir('data')
+
+    p = Projector(256, 256, fps, save, save_pos, step, renderer)
+    p.workers = workers
+    if float32: p.label_dtype = np.float32
+    p.resume = resume
+    p.outputs = outputs
+    p.shard_folder = shard_folder
+    p.shard_frames = shard_frames
+    if render_size: p.render_size = tuple(int(d) for d in render_size.lower().split('x'))
+    p.antialias = antialias
+    if shard_size: p.shard_size = tuple(int(d) for d in shard_size.lower().split('x'))
+    p.sampler = create_sampler(sampler, step, frames, seed)
+    p.dedup = dedup
+    p.dedup_images = dedup_images
+    p.dedup_quantum = dedup_quantum
+    p.metrics_file = metrics_file
+    if profile: p.profile_frames = tuple(int(f) for f in profile.split(':'))
+    for name, wireframe in wireframes.items():
+        p.add_wireframe(name, wireframe)
+    if labels_only:
+        seq = p.pose_sampler()
+        labels = p.create_label_files(len(seq))
+        p.compute_labels(seq, out=labels)
+        for label in labels.values():
+            label.flush()
+    else:
+        p.run()
 
 '''
 Resources / Credits:
@@ -0,0 +1,305 @@
+'''
+Renderers that turn batches of posed wireframes into images.
+
+PygameRenderer draws with pygame the same way Projector always has and is
+the reference. NumpyRenderer fills the faces and nodes straight into numpy
+arrays so it needs no display (or pygame) at all, which lets us generate
+data on headless machines.
+'''
+
+import numpy as np
+
+class Renderer(object):
+    '''
+    Base class for our renderers.
+    '''
+    def __init__(self, width, height, background=(10,10,50), node_radius=4,
+                 display_nodes=True, display_faces=True):
+        '''
+        Args:
+            :param width: (int) width of the images in pixels
+            :param height: (int) height of the images in pixels
+            :param background: (tuple) RGB color of the background
+            :param node_radius: (int) how big the 'points'/'nodes' are
+            :param display_nodes: (bool) whether to draw the nodes
+            :param display_faces: (bool) whether to draw the faces
+        '''
+        self.width = width
+        self.height = height
+        self.background = background
+        self.node_radius = node_radius
+        self.display_nodes = display_nodes
+        self.display_faces = display_faces
+        # set to False when the user closes the window
+        self.running = True
+
+    def render(self, wireframes, poses):
+        '''
+        Render a batch of frames.
+        Args:
+            :param wireframes: (list) the wireframes to draw, in drawing order
+            :param poses: (list) one F x N x 4 numpy array of node positions
+            per wireframe, F is frames and N is the nodes of that wireframe
+        Returns:
+            (numpy array) F x H x W x 3 uint8 images
+        '''
+        raise NotImplementedError
+
+class PygameRenderer(Renderer):
+    '''
+    Draws wireframes on a pygame surface, this is the reference renderer.
+    '''
+    def __init__(self, width, height, screen=None, fps=None, **kwargs):
+        '''
+        Args:
+            :param screen: (pygame surface) the surface to draw on, if it is
+            the display it gets updated every frame, if None an offscreen
+            surface is used
+            :param fps: (int) limit the frames per second, None for no limit
+        '''
+        super().__init__(width, height, **kwargs)
+        # only import pygame if we are going to use it
+        import pygame
+        self.pygame = pygame
+        if screen is None:
+            screen = pygame.Surface((width, height))
+        self.screen = screen
+        self.fps = fps
+        self.clock = pygame.time.Clock()
+
+    def draw(self, wireframes):
+        '''
+        Draw the wireframes at their current nodes on the screen.
+        Args:
+            :param wireframes: (list) the wireframes to draw
+        '''
+        pygame = self.pygame
+        self.screen.fill(self.background)
+        for wireframe in wireframes:
+            nodes = wireframe.nodes
+            if self.display_faces:
+                # the faces that point towards us, far ones first, faces
+                # with no area have no normal and are never drawn
+                order, visible = wireframe.visible_faces()
+                for face_idx in order[visible]:
+                    face = wireframe.faces[face_idx]
+                    color = wireframe.facecolors[face_idx]
+                    towardus_nodes_colors = []
+                    poly_nodes = []
+                    for node in face:
+                        poly_nodes.append((nodes[node,0], nodes[node,1]))
+                        towardus_nodes_colors.append((nodes[node], wireframe.nodecolors[node]))
+                    # draw all our faces
+                    pygame.draw.polygon(self.screen,
+                                        color,
+                                        poly_nodes,
+                                        0)
+                    if self.display_nodes:
+                        for node, color in towardus_nodes_colors:
+                            pygame.draw.circle(self.screen,
+                                            color,
+                                            (int(node[0]), int(node[1])),
+                                            self.node_radius,
+                                            0
+                                            )
+
+    def render(self, wireframes, poses):
+        '''
+        Render a batch of frames one by one, stops early if the window is closed.
+        '''
+        pygame = self.pygame
+        images = np.zeros((len(poses[0]), self.height, self.width, 3), dtype=np.uint8)
+        for i in range(len(images)):
+            if self.fps: self.clock.tick(self.fps)
+            if self.screen is pygame.display.get_surface():
+                for event in pygame.event.get():
+                    if event.type == pygame.QUIT:
+                        self.running = False
+                if not self.running:
+                    return images[:i]
+            for wireframe, nodes in zip(wireframes, poses):
+                wireframe.nodes = nodes[i]
+            self.draw(wireframes)
+            if self.screen is pygame.display.get_surface():
+                pygame.display.update()
+            # surfarray is indexed x,y so swap to rows,columns
+            images[i] = pygame.surfarray.array3d(self.screen).swapaxes(0, 1)
+        return images
+
+class NumpyRenderer(Renderer):
+    '''
+    Fills faces and nodes straight into numpy arrays, needs no display.
+    Faces are drawn in the same order, with the same backface test and
+    the same pixel rules as pygame so the images match PygameRenderer.
+    Faces must be convex (triangles, quads, ...).
+
+    It can also anti-alias: every pixel is split into supersample x
+    supersample points, the faces and nodes are filled on that finer grid
+    and a pixel gets the mean color of its points, so edges blend with
+    what is behind them by how much of the pixel they cover. With scale the
+    poses are drawn smaller (or bigger), a 64x64 image of poses made for
+    256x256 is rendered straight at 64x64 instead of resized afterwards.
+    '''
+    def __init__(self, width, height, chunk_size=64, supersample=1, scale=1, **kwargs):
+        '''
+        Args:
+            :param chunk_size: (int) how many frames to fill at once, bigger
+            is faster but needs more memory for the scanlines
+            :param supersample: (int) how many points per pixel along each
+            axis, 1 for the hard edges of pygame
+            :param scale: (float) how many pixels one unit of the node
+            positions is
+        '''
+        super().__init__(width, height, **kwargs)
+        self.chunk_size = chunk_size
+        self.supersample = supersample
+        self.scale = scale
+        # scanline y values, broadcast against every polygon in a chunk
+        self.rows = np.arange(height)[None,:]
+        self.fine = None
+        if supersample != 1 or scale != 1:
+            # draws the poses scaled to the finer grid
+            factor = scale * supersample
+            self.fine = NumpyRenderer(width*supersample, height*supersample,
+                                      max(1, chunk_size // supersample**2),
+                                      background=self.background,
+                                      node_radius=self.node_radius*factor,
+                                      display_nodes=self.display_nodes,
+                                      display_faces=self.display_faces)
+
+    def render(self, wireframes, poses):
+        '''
+        Render a batch of frames, a chunk of frames at a time.
+        '''
+        if self.fine is not None:
+            return self.render_supersampled(wireframes, poses)
+        images = np.empty((len(poses[0]), self.height, self.width, 3), dtype=np.uint8)
+        images[:] = self.background
+        for start in range(0, len(images), self.chunk_size):
+            chunk = images[start:start+self.chunk_size]
+            for wireframe, nodes in zip(wireframes, poses):
+                self.draw(chunk, wireframe, nodes[start:start+self.chunk_size])
+        return images
+
+    def render_supersampled(self, wireframes, poses):
+        '''
+        Render a batch of frames on the finer grid, a chunk of frames at a
+        time, and average every pixel's points.
+        '''
+        k = self.supersample
+        factor = self.scale * k
+        # x,y,z scale, the homogeneous coordinate stays 1
+        factors = np.array([factor, factor, factor, 1])
+        images = np.empty((len(poses[0]), self.height, self.width, 3), dtype=np.uint8)
+        step = self.fine.chunk_size
+        for start in range(0, len(images), step):
+            fine = self.fine.render(wireframes, [nodes[start:start+step] * factors for nodes in poses])
+            # the mean of the k x k points of every pixel, rounded, adding up
+            # the strided views is much faster than a sum over two axes
+            total = np.full((len(fine), self.height, self.width, 3), k*k//2, dtype=np.uint32)
+            for i in range(k):
+                for j in range(k):
+                    total += fine[:,i::k,j::k]
+            images[start:start+step] = total // (k*k)
+        return images
+
+    def draw(self, images, wireframe, nodes):
+        '''
+        Draw one wireframe into a chunk of images, in place.
+        Args:
+            :param images: (numpy array) F x H x W x 3 uint8 images to draw on
+            :param wireframe: (Wireframe) the wireframe, for faces and colors
+            :param nodes: (numpy array) F x N x 4 node positions for every frame
+        '''
+        if not self.display_faces:
+            return
+        faces = np.asarray(wireframe.faces)
+        facecolors = np.asarray(wireframe.facecolors)
+        nodecolors = np.asarray(wireframe.nodecolors)
+        # the faces sorted far to near and which of them point towards us
+        order, visible_faces = wireframe.visible_faces(nodes)
+        for rank in range(faces.shape[0]):
+            face_idx = order[:,rank]
+            face = faces[face_idx]
+            points = nodes[np.arange(len(nodes))[:,None], face]
+            visible = np.nonzero(visible_faces[:,rank])[0]
+            if not len(visible):
+                continue
+            frame, row, col = self.fill_polygons(points[visible,:,:2])
+            images[visible[frame], row, col] = facecolors[face_idx[visible[frame]]]
+            if self.display_nodes:
+                for k in range(face.shape[1]):
+                    frame, row, col = self.fill_circles(points[visible,k,:2])
+                    images[visible[frame], row, col] = nodecolors[face[visible[frame],k]]
+
+    def fill_polygons(self, points):
+        '''
+        Find the pixels inside a batch of convex polygons the way
+        pygame.draw.polygon does, a scanline fill between integer vertices.
+        Args:
+            :param points: (numpy array) F x K x 2 x,y of the polygon vertices
+        Returns:
+            (tuple) frame, row, column index arrays of the filled pixels
+        '''
+        # pygame truncates the vertices to ints
+        points = np.trunc(points).astype(np.int64)
+        x, y = points[:,:,0], points[:,:,1]
+        max_y = y.max(axis=1)[:,None]
+        rows = self.rows
+        # rows no edge crosses end up with an empty span
+        left = np.full((len(points), self.height), self.width, dtype=np.int64)
+        right = np.full((len(points), self.height), -1, dtype=np.int64)
+        for k in range(points.shape[1]):
+            # orient every edge so it goes from low y1 to high y2
+            xa, ya, xb, yb = x[:,k-1], y[:,k-1], x[:,k], y[:,k]
+            flip = ya > yb
+            x1, y1 = np.where(flip, xb, xa)[:,None], np.where(flip, yb, ya)[:,None]
+            x2, y2 = np.where(flip, xa, xb)[:,None], np.where(flip, ya, yb)[:,None]
+            # horizontal edges do not intersect a scanline
+            crosses = (y1 != y2) & (((rows >= y1) & (rows < y2)) | ((rows == max_y) & (y2 == max_y)))
+            # the intersections round down to whole pixels like pygame
+            den = np.where(y1 == y2, 1, y2 - y1)
+            x_cross = (rows - y1)*(x2 - x1)//den + x1
+            left = np.where(crosses, np.minimum(left, x_cross), left)
+            right = np.where(crosses, np.maximum(right, x_cross), right)
+        # turn every row's span into pixels, clipped to the image
+        left = np.maximum(left, 0)
+        right = np.minimum(right, self.width - 1)
+        counts = np.clip(right - left + 1, 0, None)
+        frame, row = np.nonzero(counts)
+        counts = counts[frame, row]
+        starts = np.cumsum(counts) - counts
+        col = np.arange(counts.sum()) - np.repeat(starts - left[frame, row], counts)
+        return np.repeat(frame, counts), np.repeat(row, counts), col
+
+    def fill_circles(self, centers):
+        '''
+        Find the pixels inside a batch of node discs, centers are truncated to ints
+        like the int() in the pygame renderer. Matches pygame.draw.circle exactly
+        for the default radius.
+        Args:
+            :param centers: (numpy array) F x 2 x,y of the disc centers
+        Returns:
+            (tuple) frame, row, column index arrays of the filled pixels
+        '''
+        # the disc is the same for every center so find its pixel
+        # offsets once and stamp them at every center
+        r = int(np.ceil(self.node_radius))
+        offset_y, offset_x = np.nonzero(self.disc_stamp())
+        centers = np.trunc(centers).astype(np.int64)
+        rows = centers[:,1,None] + offset_y - r
+        cols = centers[:,0,None] + offset_x - r
+        frame = np.broadcast_to(np.arange(len(centers))[:,None], rows.shape)
+        inside = (rows >= 0) & (rows < self.height) & (cols >= 0) & (cols < self.width)
+        return frame[inside], rows[inside], cols[inside]
+
+    def disc_stamp(self):
+        '''
+        Return a 2r+1 x 2r+1 bool mask of a node disc centered at r,r, r is
+        the radius rounded up when it isn't a whole number.
+        '''
+        radius = self.node_radius
+        r = int(np.ceil(radius))
+        offsets = np.arange(-r, r+1) + 0.5
+        # a node is never smaller than a pixel
+        return offsets[None,:]**2 + offsets[:,None]**2 <= max(radius**2 - radius/2, 0.5)
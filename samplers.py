@@ -0,0 +1,266 @@
+'''
+Pose samplers, the rotations a run renders.
+
+The euler grid renders every x,y,z combination of a step size, which is
+cubic in 1/step and crowds the poses together near gimbal lock. The other
+samplers cover the rotations (SO(3)) evenly with far fewer frames.
+
+Every sampler is a lazy, seeded sequence of euler x,y,z rotations in
+radians, the same layout as the labels. Indexing one works the rotations
+out for just those frames, so the same frame always gets the same pose
+however the run is split into batches, shards or workers.
+
+    sampler = SuperFibonacciSampler(20000, seed=1)
+    rotations = sampler[0:1000]           # 1000 x 3 euler angles
+    matrices = sampler.matrices(0, 1000)  # 1000 x 4 x 4 rotation matrices
+'''
+
+import numpy as np
+import wireframe as wf
+
+class Sampler(object):
+    '''
+    Base class for our samplers.
+    '''
+    def __len__(self):
+        raise NotImplementedError
+
+    def rotations(self, indices):
+        '''
+        Return the rotations of some frames.
+        Args:
+            :param indices: (numpy array) the frame indices
+        Returns:
+            (numpy array) F x 3 euler x,y,z rotations in radians
+        '''
+        raise NotImplementedError
+
+    def describe(self):
+        '''
+        Return the settings of the sampler as plain values, so runs
+        made with different poses can be told apart.
+        '''
+        raise NotImplementedError
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return self.rotations(np.arange(*key.indices(len(self))))
+        indices = np.asarray(key)
+        if indices.ndim == 0:
+            return self.rotations(indices.reshape(1))[0]
+        return self.rotations(np.where(indices < 0, indices + len(self), indices))
+
+    def matrices(self, start, stop):
+        '''
+        Return the rotation matrices of the frames start to stop.
+        Returns:
+            (numpy array) F x 4 x 4, the same as wireframe.create_rot_batch
+        '''
+        return wf.create_rot_batch(self[start:stop])
+
+class EulerGridSampler(Sampler):
+    '''
+    Every combination of x,y,z rotations from 0 to 6.3 in steps of step_size,
+    x changes slowest, the same order Projector always rendered in.
+    '''
+    def __init__(self, step_size):
+        self.step_size = step_size
+        self.angles = np.arange(0, 6.3, step_size)
+
+    def __len__(self):
+        return len(self.angles)**3
+
+    def rotations(self, indices):
+        n = len(self.angles)
+        x, rest = np.divmod(indices, n*n)
+        y, z = np.divmod(rest, n)
+        return np.stack((self.angles[x], self.angles[y], self.angles[z]), axis=1)
+
+    def describe(self):
+        return {'sampler': 'grid', 'step_size': self.step_size}
+
+class RandomSampler(Sampler):
+    '''
+    Uniformly random rotations, from uniformly random unit quaternions.
+    '''
+    # frames are drawn in blocks, each block from its own seeded generator
+    block_size = 4096
+
+    def __init__(self, frames, seed=None):
+        '''
+        Args:
+            :param frames: (int) how many poses
+            :param seed: (int) the seed, None picks one (which is then fixed)
+        '''
+        if seed is None:
+            seed = int(np.random.SeedSequence().entropy % 2**32)
+        self.frames = frames
+        self.seed = seed
+
+    def __len__(self):
+        return self.frames
+
+    def rotations(self, indices):
+        blocks, rows = np.divmod(indices, self.block_size)
+        quaternions = np.empty((len(indices), 4))
+        for block in np.unique(blocks):
+            which = blocks == block
+            u = np.random.default_rng((self.seed, int(block))).random((self.block_size, 3))
+            quaternions[which] = random_quaternions(u)[rows[which]]
+        return quaternion_to_euler(quaternions)
+
+    def describe(self):
+        return {'sampler': 'random', 'frames': self.frames, 'seed': self.seed}
+
+class SuperFibonacciSampler(Sampler):
+    '''
+    A low discrepancy spiral of rotations (Alexa, "Super-Fibonacci Spirals",
+    CVPR 2022), evenly spread for any number of frames. The seed rotates the
+    whole spiral at random.
+    '''
+    phi = np.sqrt(2)
+    psi = 1.533751168755204288118041
+
+    def __init__(self, frames, seed=None):
+        '''
+        Args:
+            :param frames: (int) how many poses
+            :param seed: (int) seed for a random rotation of the spiral, None for none
+        '''
+        self.frames = frames
+        self.seed = seed
+
+    def __len__(self):
+        return self.frames
+
+    def rotations(self, indices):
+        s = indices + 0.5
+        t = s / self.frames
+        r, R = np.sqrt(t), np.sqrt(1 - t)
+        alpha = 2*np.pi*s/self.phi
+        beta = 2*np.pi*s/self.psi
+        quaternions = np.stack((r*np.sin(alpha), r*np.cos(alpha),
+                                R*np.sin(beta), R*np.cos(beta)), axis=1)
+        return quaternion_to_euler(seeded_rotation(quaternions, self.seed))
+
+    def describe(self):
+        return {'sampler': 'fibonacci', 'frames': self.frames, 'seed': self.seed}
+
+class HopfSampler(Sampler):
+    '''
+    A grid of rotations from the Hopf fibration (Yershova et al., "Generating
+    Uniform Incremental Grids on SO(3) Using the Hopf Fibration", 2010),
+    evenly spread points on the sphere for the axis times evenly spread
+    turns about it. The grid has about frames poses.
+    '''
+    def __init__(self, frames, seed=None):
+        '''
+        Args:
+            :param frames: (int) about how many poses
+            :param seed: (int) seed for a random rotation of the grid, None for none
+        '''
+        # the spacing on the sphere and the circle match when the circle
+        # has sqrt(pi * sphere points) points
+        self.sphere_points = max(1, int(round((frames**2/np.pi)**(1/3))))
+        self.circle_points = max(1, int(round(np.sqrt(np.pi*self.sphere_points))))
+        self.frames = frames
+        self.seed = seed
+
+    def __len__(self):
+        return self.sphere_points * self.circle_points
+
+    def rotations(self, indices):
+        point, turn = np.divmod(indices, self.circle_points)
+        # a fibonacci lattice on the sphere
+        s = point + 0.5
+        theta = np.arccos(1 - 2*s/self.sphere_points)
+        phi = np.mod(2*np.pi*s/((1 + np.sqrt(5))/2), 2*np.pi)
+        psi = 2*np.pi*(turn + 0.5)/self.circle_points
+        quaternions = np.stack((np.cos(theta/2)*np.cos(psi/2),
+                                np.cos(theta/2)*np.sin(psi/2),
+                                np.sin(theta/2)*np.cos(phi + psi/2),
+                                np.sin(theta/2)*np.sin(phi + psi/2)), axis=1)
+        return quaternion_to_euler(seeded_rotation(quaternions, self.seed))
+
+    def describe(self):
+        return {'sampler': 'hopf', 'frames': self.frames, 'seed': self.seed}
+
+def create_sampler(name, step_size=0.3, frames=10000, seed=None):
+    '''
+    Create a sampler by name, grid, random, fibonacci or hopf.
+    Args:
+        :param name: (str) the sampler
+        :param step_size: (float) the step size of the grid
+        :param frames: (int) how many poses the other samplers make
+        :param seed: (int) the seed of the other samplers
+    '''
+    if name == 'grid':
+        return EulerGridSampler(step_size)
+    samplers = {'random': RandomSampler, 'fibonacci': SuperFibonacciSampler, 'hopf': HopfSampler}
+    if name not in samplers:
+        raise ValueError(f'{name} is not a sampler, use grid, {", ".join(samplers)}')
+    return samplers[name](frames, seed)
+
+def random_quaternions(u):
+    '''
+    Turn uniform numbers into uniformly random unit quaternions (Shoemake, 1992).
+    Args:
+        :param u: (numpy array) F x 3 uniform numbers in [0, 1)
+    Returns:
+        (numpy array) F x 4 w,x,y,z quaternions
+    '''
+    a, b = np.sqrt(1 - u[:,0]), np.sqrt(u[:,0])
+    t1, t2 = 2*np.pi*u[:,1], 2*np.pi*u[:,2]
+    return np.stack((b*np.cos(t2), a*np.sin(t1), a*np.cos(t1), b*np.sin(t2)), axis=1)
+
+def seeded_rotation(quaternions, seed):
+    '''
+    Rotate quaternions by one random rotation picked by the seed, the
+    spread of the rotations stays the same. None leaves them as they are.
+    '''
+    if seed is None:
+        return quaternions
+    w0, x0, y0, z0 = random_quaternions(np.random.default_rng(seed).random((1, 3)))[0]
+    w, x, y, z = quaternions.T
+    return np.stack((w0*w - x0*x - y0*y - z0*z,
+                     w0*x + x0*w + y0*z - z0*y,
+                     w0*y - x0*z + y0*w + z0*x,
+                     w0*z + x0*y - y0*x + z0*w), axis=1)
+
+def quaternion_to_matrix(quaternions):
+    '''
+    Turn unit quaternions into 3 x 3 rotation matrices.
+    Args:
+        :param quaternions: (numpy array) F x 4 w,x,y,z quaternions
+    Returns:
+        (numpy array) F x 3 x 3 rotation matrices
+    '''
+    w, x, y, z = quaternions.T
+    return np.stack((np.stack((1 - 2*(y*y + z*z), 2*(x*y - z*w), 2*(x*z + y*w)), axis=1),
+                     np.stack((2*(x*y + z*w), 1 - 2*(x*x + z*z), 2*(y*z - x*w)), axis=1),
+                     np.stack((2*(x*z - y*w), 2*(y*z + x*w), 1 - 2*(x*x + y*y)), axis=1)), axis=1)
+
+def matrix_to_euler(matrices):
+    '''
+    Find the x,y,z rotations whose create_rot_batch matrix is the given one,
+    the inverse of create_rot_x(x) @ create_rot_y(y) @ create_rot_z(z).
+    Args:
+        :param matrices: (numpy array) F x 3 x 3 (or 4 x 4) rotation matrices
+    Returns:
+        (numpy array) F x 3 euler x,y,z rotations in radians, from 0 to 2 pi
+    '''
+    m = matrices
+    y = np.arcsin(np.clip(m[:,0,2], -1, 1))
+    x = np.arctan2(-m[:,1,2], m[:,2,2])
+    z = np.arctan2(-m[:,0,1], m[:,0,0])
+    # at gimbal lock only x + z (or x - z) is known, put it all in x
+    locked = np.abs(m[:,0,2]) > 1 - 1e-12
+    x = np.where(locked, np.arctan2(m[:,2,1], m[:,1,1]), x)
+    z = np.where(locked, 0, z)
+    return np.mod(np.stack((x, y, z), axis=1), 2*np.pi)
+
+def quaternion_to_euler(quaternions):
+    '''
+    Turn unit quaternions into euler x,y,z rotations for the labels.
+    '''
+    return matrix_to_euler(quaternion_to_matrix(quaternions))
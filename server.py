@@ -0,0 +1,280 @@
+'''
+A local HTTP server that renders poses on request.
+
+Evaluation tooling often needs the image of one pose, to put a model's
+predicted x,y,z rotation next to the ground truth or to replay a failure.
+The server keeps a headless Projector (the numpy renderer) and renders
+batches of poses at any size, resized the same way the dataset outputs
+are, or with --antialias drawn straight at that size like datasets made
+with --render-size and --antialias. Images are kept in an LRU cache keyed
+by the pose, rounded to a quantum, and the size, so asking for the same
+pose again skips rendering.
+
+    python server.py --port 8000
+    curl 'http://127.0.0.1:8000/render?x=0.3&y=1.2&z=0&size=64x64&format=png' > pose.png
+    curl -d '{"poses": [[0.3, 1.2, 0], [0, 0, 0]], "format": "png"}' http://127.0.0.1:8000/render
+    images = request_images('http://127.0.0.1:8000', [(0.3, 1.2, 0)], (64, 64))
+
+GET /render returns one image, POST /render takes json with a list of
+poses, an optional size [width, height], format (png, jpg, bmp or npy) and
+quality, and returns the images as a FRAMES x H x W x 3 .npy array or as
+json {"images": [base64, ...]}. GET /stats returns the cache hits and misses.
+'''
+
+import io
+import sys
+import json
+import base64
+import mimetypes
+import argparse
+import threading
+import collections
+import urllib.parse
+import urllib.request
+import http.server
+import numpy as np
+import wireframe as wf
+from PIL import Image
+from projector import Projector
+from img_converter import parse_target
+from meshes import load_mesh
+
+class RenderService(object):
+    '''
+    Renders poses with a projector, caching the most recent images.
+    '''
+    def __init__(self, projector, cache_size=1024, quantum=1e-6):
+        '''
+        Args:
+            :param projector: (Projector) the projector with the wireframes to render,
+            its renderer, size and centers are used
+            :param cache_size: (int) how many images to keep, 0 for no cache
+            :param quantum: (float) poses closer than this many radians on every
+            axis are the same pose
+        '''
+        self.projector = projector
+        # a renderer for every size we have been asked for
+        self.renderers = {}
+        self.cache_size = cache_size
+        self.quantum = quantum
+        # (quantized x, y, z, width, height) -> image, oldest first
+        self.cache = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        # requests come in on many threads
+        self.lock = threading.Lock()
+
+    def keys(self, poses, size):
+        '''
+        Return the cache key of every pose at a size.
+        '''
+        quantized = np.round(poses / self.quantum).astype(np.int64)
+        return [tuple(pose) + tuple(size) for pose in quantized.tolist()]
+
+    def render(self, poses, size=None):
+        '''
+        Render a batch of poses, from the cache where we can.
+        Args:
+            :param poses: (list) x,y,z rotations in radians, one per frame
+            :param size: (tuple) width, height of the images, None for the
+            size of the projector
+        Returns:
+            (numpy array) F x H x W x 3 uint8 images
+        '''
+        poses = np.asarray(poses, dtype=float).reshape(-1, 3)
+        # NaN, inf and huge angles would all round to the same key
+        if not np.isfinite(poses).all() or (np.abs(poses) / self.quantum >= 2**62).any():
+            raise ValueError('poses have to be finite and smaller than 2**62 quanta')
+        size = tuple(int(d) for d in size) if size else (self.projector.width, self.projector.height)
+        keys = self.keys(poses, size)
+        images = np.empty((len(poses), size[1], size[0], 3), dtype=np.uint8)
+        # the lock only guards the cache, requests render at the same time
+        with self.lock:
+            # the first frame of every pose we don't have, once each
+            missing = {}
+            for i, key in enumerate(keys):
+                if key in self.cache:
+                    self.cache.move_to_end(key)
+                    images[i] = self.cache[key]
+                else:
+                    missing.setdefault(key, i)
+            # a pose asked for twice in a batch is only rendered once
+            self.misses += len(missing)
+            self.hits += len(keys) - len(missing)
+        if missing:
+            rendered = dict(zip(missing, self.render_poses(poses[list(missing.values())], size)))
+            with self.lock:
+                for key, image in rendered.items():
+                    self.store(key, image)
+            for i, key in enumerate(keys):
+                if key in rendered:
+                    images[i] = rendered[key]
+        return images
+
+    def render_poses(self, poses, size):
+        '''
+        Render poses without the cache. Anti-aliased projectors draw them
+        straight at the size, others are resized like the dataset outputs.
+        '''
+        render_size = size if self.projector.antialias != 1 else None
+        with self.lock:
+            if render_size not in self.renderers:
+                self.renderers[render_size] = self.projector.create_renderer(render_size)
+            renderer = self.renderers[render_size]
+        batch = self.projector.transform_all_batch(poses)
+        images = renderer.render([self.projector.wireframes[name] for name in batch],
+                                 list(batch.values()))
+        if images.shape[1:3] != (size[1], size[0]):
+            images = np.stack([np.asarray(Image.fromarray(image).resize(size)) for image in images])
+        return images
+
+    def store(self, key, image):
+        '''
+        Put an image in the cache, dropping the least recently used ones,
+        call it holding the lock.
+        '''
+        if self.cache_size <= 0:
+            return
+        # a copy, a view would keep the whole rendered batch alive
+        self.cache[key] = image.copy()
+        self.cache.move_to_end(key)
+        while len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+
+    def stats(self):
+        '''
+        Return how well the cache is doing.
+        '''
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses,
+                    'cached': len(self.cache), 'cache_size': self.cache_size}
+
+def encode_image(image, format='png', quality=100):
+    '''
+    Encode an image to bytes, the same way Projector.save_image saves it.
+    Args:
+        :param image: (numpy array) H x W x 3 uint8 image
+        :param format: (str) png, jpg, bmp, ...
+        :param quality: (int) the quality of lossy formats
+    '''
+    _, _, format, _, _ = parse_target(f'::{format}')
+    buffer = io.BytesIO()
+    Image.fromarray(image).save(buffer, format=format, subsampling=0, quality=quality)
+    return buffer.getvalue()
+
+def encode_array(images):
+    '''
+    Encode images as the bytes of a .npy file.
+    '''
+    buffer = io.BytesIO()
+    np.save(buffer, images)
+    return buffer.getvalue()
+
+def parse_size(size):
+    '''
+    Parse a WIDTHxHEIGHT size, None stays None.
+    '''
+    return tuple(int(d) for d in size.lower().split('x')) if size else None
+
+class RenderHandler(http.server.BaseHTTPRequestHandler):
+    '''
+    Answers GET /render, POST /render and GET /stats with the server's service.
+    '''
+    def do_GET(self):
+        url = urllib.parse.urlparse(self.path)
+        query = dict(urllib.parse.parse_qsl(url.query))
+        if url.path == '/stats':
+            return self.reply(json.dumps(self.server.service.stats()).encode(), 'application/json')
+        if url.path != '/render':
+            return self.error(404, f'{url.path} not found')
+        try:
+            pose = [float(query.get(axis, 0)) for axis in 'xyz']
+            image = self.server.service.render([pose], parse_size(query.get('size')))
+            format = query.get('format', 'png').lower()
+            if format == 'npy':
+                return self.reply(encode_array(image), 'application/octet-stream')
+            # jpg is image/jpeg
+            content_type = mimetypes.guess_type(f'image.{format}')[0] or 'application/octet-stream'
+            self.reply(encode_image(image[0], format, int(query.get('quality', 100))), content_type)
+        except (ValueError, KeyError, OSError) as e:
+            self.error(400, str(e))
+
+    def do_POST(self):
+        if urllib.parse.urlparse(self.path).path != '/render':
+            return self.error(404, f'{self.path} not found')
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            request = json.loads(self.rfile.read(length))
+            images = self.server.service.render(request['poses'], request.get('size'))
+            format = request.get('format', 'npy').lower()
+            if format == 'npy':
+                return self.reply(encode_array(images), 'application/octet-stream')
+            quality = int(request.get('quality', 100))
+            encoded = [base64.b64encode(encode_image(image, format, quality)).decode('ascii')
+                       for image in images]
+            self.reply(json.dumps({'format': format, 'images': encoded}).encode(), 'application/json')
+        except (ValueError, KeyError, TypeError, OSError) as e:
+            self.error(400, str(e))
+
+    def reply(self, body, content_type):
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def error(self, code, message):
+        body = json.dumps({'error': message}).encode()
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+def create_server(service, host='127.0.0.1', port=8000):
+    '''
+    Create an HTTP server for a render service, call serve_forever() on it.
+    '''
+    server = http.server.ThreadingHTTPServer((host, port), RenderHandler)
+    server.service = service
+    return server
+
+def request_images(url, poses, size=None):
+    '''
+    Ask a running server to render poses.
+    Args:
+        :param url: (str) the server, like http://127.0.0.1:8000
+        :param poses: (list) x,y,z rotations in radians, one per frame
+        :param size: (tuple) width, height of the images, None for the server's size
+    Returns:
+        (numpy array) F x H x W x 3 uint8 images
+    '''
+    body = json.dumps({'poses': np.asarray(poses, dtype=float).reshape(-1, 3).tolist(),
+                       'size': list(size) if size else None, 'format': 'npy'}).encode()
+    request = urllib.request.Request(url.rstrip('/') + '/render', body,
+                                     {'Content-Type': 'application/json'})
+    with urllib.request.urlopen(request) as response:
+        return np.load(io.BytesIO(response.read()))
+
+def parse_args(args):
+    p = argparse.ArgumentParser()
+    p.add_argument('--host', type=str, default='127.0.0.1', help='The address to listen on.')
+    p.add_argument('--port', type=int, default=8000, help='The port to listen on.')
+    p.add_argument('-m', '--mesh', type=str, help='Render the wireframe in this .obj or .ply file instead of the cube.')
+    p.add_argument('--cache-size', type=int, default=1024, help='How many images to keep in the cache.')
+    p.add_argument('--antialias', type=int, default=1, help='Anti-alias with this many points per pixel along each axis and draw straight at the size asked for.')
+    p.add_argument('--quantum', type=float, default=1e-6, help='Poses closer than this many radians are the same pose.')
+    return p.parse_args(args)
+
+if __name__ == '__main__':
+    args = parse_args(sys.argv[1:]).__dict__
+    p = Projector(256, 256, None, False, False, 0.3, renderer='numpy')
+    p.antialias = args['antialias']
+    p.add_wireframe('cube1', load_mesh(args['mesh']) if args['mesh'] else wf.create_cube())
+    server = create_server(RenderService(p, args['cache_size'], args['quantum']), args['host'], args['port'])
+    print(f'rendering on http://{args["host"]}:{args["port"]}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
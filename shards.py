@@ -0,0 +1,260 @@
+'''
+Packed binary shards of the dataset.
+
+Instead of hundreds of thousands of tiny image files every shard is one
+contiguous uint8 FRAMES x H x W x 3 .npy array of images and the matching
+FRAMES x NODES x 6 slice of the labels, plus one json index for all shards.
+Scenes with many wireframes pack their labels along the nodes, the index
+has the node range of every wireframe under 'objects'. Runs that skip
+duplicate frames (see dedup.py) leave their images out, keep the frame
+every frame duplicates in the shard folder, and the reader returns the
+image of the frame they duplicate instead.
+Shards are memory mapped, so reading a batch is a slice of a file instead
+of a call to open() per image.
+
+    reader = ShardReader('shards', 'cube1')
+    image, label = reader[1234]
+    images, labels = reader.batch(0, 64)
+'''
+
+import os
+import json
+import numpy as np
+from PIL import Image
+
+class ShardWriter(object):
+    '''
+    Writes frames into the shards made by create_shards by their global
+    frame index, any number of processes can fill them in any order.
+    '''
+    def __init__(self, folder, name):
+        '''
+        Args:
+            :param folder: (str) the folder the shards are in
+            :param name: (str) the name of the dataset
+        '''
+        self.folder = folder
+        self.name = name
+        with open(index_path(folder, name)) as f:
+            self.index = json.load(f)
+        self.shards = None
+
+    def open_shards(self):
+        '''
+        Open the images and labels of every shard for writing.
+        '''
+        if self.shards is None:
+            self.shards = [(np.lib.format.open_memmap(os.path.join(self.folder, shard['images']), mode='r+'),
+                            np.lib.format.open_memmap(os.path.join(self.folder, shard['labels']), mode='r+'))
+                           for shard in self.index['shards']]
+        return self.shards
+
+    def write_images(self, frames, images):
+        '''
+        Write images, resized to the shard size if they need to be.
+        Args:
+            :param frames: (list) the global frame index of every image
+            :param images: (numpy array) F x H x W x 3 uint8 images
+        '''
+        shards = self.open_shards()
+        height, width = self.index['image_shape'][:2]
+        for frame, image in zip(frames, images):
+            if image.shape[:2] != (height, width):
+                image = np.asarray(Image.fromarray(image).resize((width, height)))
+            shard, row = divmod(int(frame), self.index['frames_per_shard'])
+            shards[shard][0][row] = image
+
+    def write_labels(self, start, labels):
+        '''
+        Write the labels of a run of frames, they can span shards.
+        Args:
+            :param start: (int) the global frame index of the first row
+            :param labels: (numpy array) F x NODES x 6 labels
+        '''
+        shards = self.open_shards()
+        frames_per_shard = self.index['frames_per_shard']
+        while len(labels):
+            shard, row = divmod(start, frames_per_shard)
+            n = min(len(labels), frames_per_shard - row)
+            shards[shard][1][row:row+n] = labels[:n]
+            start, labels = start + n, labels[n:]
+
+    def write_dedup(self, canonical):
+        '''
+        Save the canonical frame of every frame next to the shards, so the
+        folder can be copied on its own. Written atomically, call it again
+        whenever the canonical frames change.
+        Args:
+            :param canonical: (numpy array) the canonical frame of every frame
+        '''
+        path = os.path.join(self.folder, self.index['dedup'])
+        with open(path + '.tmp', 'wb') as f:
+            np.save(f, np.asarray(canonical))
+        os.replace(path + '.tmp', path)
+
+    def flush(self):
+        '''
+        Make sure everything written so far is on disk.
+        '''
+        for images, labels in self.shards or []:
+            images.flush()
+            labels.flush()
+
+    def __getstate__(self):
+        '''
+        Memory maps are opened again in worker processes, never copied.
+        '''
+        state = self.__dict__.copy()
+        state['shards'] = None
+        return state
+
+class ShardReader(object):
+    '''
+    Random access to a sharded dataset, returns numpy views into the memory
+    mapped shards wherever it can.
+    '''
+    def __init__(self, folder, name):
+        '''
+        Args:
+            :param folder: (str) the folder the shards are in
+            :param name: (str) the name of the dataset
+        '''
+        with open(index_path(folder, name)) as f:
+            self.index = json.load(f)
+        self.images = [np.load(os.path.join(folder, shard['images']), mmap_mode='r')
+                       for shard in self.index['shards']]
+        self.labels = [np.load(os.path.join(folder, shard['labels']), mmap_mode='r')
+                       for shard in self.index['shards']]
+        self.frames_per_shard = self.index['frames_per_shard']
+        # the frame whose image every frame uses, None if every frame has its own
+        self.canonical = None
+        if self.index.get('dedup'):
+            canonical = np.load(os.path.join(folder, self.index['dedup']))
+            # a duplicate can point to a frame that duplicates an image
+            self.canonical = canonical[canonical]
+
+    def image_frames(self, indices):
+        '''
+        Return the frames whose images hold the images of the frames indices.
+        '''
+        if self.canonical is None:
+            return indices
+        return self.canonical[indices]
+
+    def __len__(self):
+        return self.index['frames']
+
+    def __getitem__(self, idx):
+        '''
+        Return the image and labels of one frame, as views.
+        '''
+        if idx < 0: idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError(f'frame {idx} is out of range for {len(self)} frames')
+        shard, row = divmod(idx, self.frames_per_shard)
+        image_shard, image_row = divmod(int(self.image_frames(idx)), self.frames_per_shard)
+        return self.images[image_shard][image_row], self.labels[shard][row]
+
+    def batch(self, start, stop):
+        '''
+        Return the images and labels of the frames start to stop, views if
+        they are all in one shard, otherwise copies joined across shards.
+        '''
+        stop = min(stop, len(self))
+        frames = np.arange(start, stop)
+        if (self.image_frames(frames) != frames).any():
+            # some images are elsewhere, gather them
+            return self.take(frames)
+        shard, row = divmod(start, self.frames_per_shard)
+        if row + stop - start <= self.frames_per_shard:
+            return (self.images[shard][row:row+stop-start],
+                    self.labels[shard][row:row+stop-start])
+        parts = []
+        while start < stop:
+            row = start % self.frames_per_shard
+            n = min(stop - start, self.frames_per_shard - row)
+            parts.append(self.batch(start, start + n))
+            start += n
+        return (np.concatenate([images for images, _ in parts]),
+                np.concatenate([labels for _, labels in parts]))
+
+    def take(self, indices):
+        '''
+        Return the images and labels of any frames (copies), reading them
+        shard by shard in order.
+        Args:
+            :param indices: (list) the frame indices
+        '''
+        indices = np.asarray(indices)
+        image_shape = tuple(self.index['image_shape'])
+        label_shape = tuple(self.index['label_shape'])
+        images = np.empty((len(indices),) + image_shape, dtype=np.uint8)
+        labels = np.empty((len(indices),) + label_shape, dtype=self.index['label_dtype'])
+        shards, rows = np.divmod(indices, self.frames_per_shard)
+        for shard in np.unique(shards):
+            which = np.nonzero(shards == shard)[0]
+            labels[which] = self.labels[shard][rows[which]]
+        shards, rows = np.divmod(self.image_frames(indices), self.frames_per_shard)
+        for shard in np.unique(shards):
+            which = np.nonzero(shards == shard)[0]
+            images[which] = self.images[shard][rows[which]]
+        return images, labels
+
+def create_shards(folder, name, frames, frames_per_shard, image_shape,
+                  label_shape, label_dtype=np.float64, objects=None, dedup=None):
+    '''
+    Create every shard file and the index up front, then return a writer.
+    Args:
+        :param folder: (str) the folder to put the shards in
+        :param name: (str) the name of the dataset, prefixes every file
+        :param frames: (int) how many frames there are in total
+        :param frames_per_shard: (int) how many frames go in one shard
+        :param image_shape: (tuple) H x W x 3 shape of the images
+        :param label_shape: (tuple) NODES x 6 shape of the labels of one frame
+        :param label_dtype: (numpy dtype) the type to store the labels as
+        :param objects: (dict) name -> number of nodes of every wireframe whose
+        labels are packed along the nodes, in order
+        :param dedup: (numpy array) the canonical frame of every frame, if
+        duplicate frames are left out, saved in the folder
+    Returns:
+        (ShardWriter) a writer for the new shards
+    '''
+    index = {
+        'frames': frames,
+        'frames_per_shard': frames_per_shard,
+        'image_shape': list(image_shape),
+        'label_shape': list(label_shape),
+        'label_dtype': np.dtype(label_dtype).name,
+        'shards': [],
+        'dedup': None if dedup is None else f'{name}-dedup.npy',
+    }
+    if objects is not None:
+        # where the nodes of every wireframe are in the packed labels
+        index['objects'], start = {}, 0
+        for obj, nodes in objects.items():
+            index['objects'][obj] = [start, start + nodes]
+            start += nodes
+    os.makedirs(folder, exist_ok=True)
+    for i, start in enumerate(range(0, frames, frames_per_shard)):
+        stop = min(start + frames_per_shard, frames)
+        shard = {'images': f'{name}-shard-{i:05d}-images.npy',
+                 'labels': f'{name}-shard-{i:05d}-labels.npy',
+                 'start': start,
+                 'stop': stop}
+        np.lib.format.open_memmap(os.path.join(folder, shard['images']), mode='w+',
+                                  dtype=np.uint8, shape=(stop - start,) + tuple(image_shape))
+        np.lib.format.open_memmap(os.path.join(folder, shard['labels']), mode='w+',
+                                  dtype=label_dtype, shape=(stop - start,) + tuple(label_shape))
+        index['shards'].append(shard)
+    with open(index_path(folder, name), 'w') as f:
+        json.dump(index, f)
+    writer = ShardWriter(folder, name)
+    if dedup is not None:
+        writer.write_dedup(dedup)
+    return writer
+
+def index_path(folder, name):
+    '''
+    Return the path of the index of a sharded dataset.
+    '''
+    return os.path.join(folder, f'{name}-index.json')
@@ -0,0 +1,105 @@
+'''
+Checks a label file without rendering anything.
+
+Every row of a label file holds the rotation of the frame and the node
+positions it should give, so the positions can be worked out again from
+the rotations and the wireframe, a chunk of frames at a time with batched
+matrix ops. The file is memory mapped so it can be bigger than RAM.
+
+python validate.py data/cube1-1.23.5-2018-05-11-10-00-00.npy
+
+Exits with 1 if any frame is wrong, so it can gate a run.
+'''
+import sys
+import time
+import argparse
+import numpy as np
+import wireframe as wf
+from meshes import load_mesh
+
+def validate_labels(labels, wireframe, center=(128, 128, 0), chunk_size=100000, tolerance=None):
+    '''
+    Compare the node positions in a label file against the positions the
+    wireframe has at the stored rotations.
+    Args:
+        :param labels: (str or numpy array) the label file, or a FRAMES x N x 6 array
+        :param wireframe: (Wireframe) the wireframe the labels were made for
+        :param center: (tuple) x,y,z the wireframe was centered at
+        :param chunk_size: (int) how many frames to check at once
+        :param tolerance: (float) the biggest error allowed, defaults to
+        one that fits the precision of the file
+    Returns:
+        (dict) the report, 'ok' is True if every frame is right
+    '''
+    if isinstance(labels, str):
+        labels = np.load(labels, mmap_mode='r')
+    if labels.ndim != 3 or labels.shape[1:] != (wireframe.nodes_initial.shape[0], 6):
+        raise ValueError(f'labels are {labels.shape} but should be FRAMES x {wireframe.nodes_initial.shape[0]} x 6')
+    if tolerance is None:
+        # float32 files round the positions and the rotations
+        tolerance = 1e3 * np.finfo(labels.dtype).eps
+    start_time = time.time()
+    max_error = 0.
+    error_sum = 0.
+    nan_frames = 0
+    rotation_frames = 0
+    bad_frames = []
+    for start in range(0, len(labels), chunk_size):
+        chunk = np.asarray(labels[start:start+chunk_size], dtype=np.float64)
+        # the rotation is the same for every node of a frame
+        rotations = chunk[:,0,3:]
+        nan = np.isnan(chunk).any(axis=(1,2))
+        rotation_bad = (chunk[:,:,3:] != rotations[:,None,:]).any(axis=(1,2)) & ~nan
+        expected = wireframe.transform_batch(np.nan_to_num(rotations), center)[:,:,:3]
+        error = np.abs(chunk[:,:,:3] - expected).max(axis=(1,2))
+        error[nan] = 0
+        max_error = max(max_error, error.max(initial=0))
+        error_sum += error[~nan].sum()
+        nan_frames += nan.sum()
+        rotation_frames += rotation_bad.sum()
+        bad_frames.extend((start + np.nonzero(nan | rotation_bad | (error > tolerance))[0]).tolist())
+    checked = len(labels) - nan_frames
+    return {
+        'ok': not bad_frames,
+        'frames': len(labels),
+        'max_error': float(max_error),
+        'mean_error': float(error_sum / checked) if checked else 0.,
+        'tolerance': float(tolerance),
+        'nan_frames': int(nan_frames),
+        'rotation_frames': int(rotation_frames),
+        'bad_frames': bad_frames,
+        'seconds': time.time() - start_time,
+    }
+
+def print_report(path, report):
+    '''
+    Print a validation report.
+    '''
+    print(f'{path}: {report["frames"]} frames checked in {report["seconds"]:.2f}s')
+    print(f'max error {report["max_error"]:.3g}, mean frame error {report["mean_error"]:.3g} (tolerance {report["tolerance"]:.3g})')
+    print(f'{report["nan_frames"]} frames with NaNs, {report["rotation_frames"]} frames whose nodes disagree on the rotation')
+    bad = report['bad_frames']
+    if bad:
+        print(f'{len(bad)} bad frames, the first are {bad[:10]}')
+    else:
+        print('all frames are good')
+
+def parse_args(args):
+    p = argparse.ArgumentParser()
+    p.add_argument('labels', type=str, nargs='+', help='The label files to check.')
+    p.add_argument('-c', '--center', type=str, default='128,128,0', help='x,y,z the wireframe was centered at.')
+    p.add_argument('-m', '--mesh', type=str, help='The .obj or .ply file the labels were made for, defaults to the cube.')
+    p.add_argument('--chunk-size', type=int, default=100000, help='How many frames to check at once.')
+    p.add_argument('--tolerance', type=float, help='The biggest error allowed, defaults to one that fits the precision of the file.')
+    return p.parse_args(args)
+
+if __name__ == '__main__':
+    args = parse_args(sys.argv[1:]).__dict__
+    center = tuple(float(c) for c in args['center'].split(','))
+    cube = load_mesh(args['mesh']) if args['mesh'] else wf.create_cube()
+    ok = True
+    for path in args['labels']:
+        report = validate_labels(path, cube, center, args['chunk_size'], args['tolerance'])
+        print_report(path, report)
+        ok = ok and report['ok']
+    sys.exit(0 if ok else 1)
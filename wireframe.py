@@ -4,7 +4,6 @@
 vectorized implementation fo the 3d cube viewer.
 '''
 
-import copy
 import numpy as np
 
 def create_translation_matrix(dx=0, dy=0, dz=0):
@@ -83,11 +82,186 @@ def create_rot_z(radians):
                     [0,0,0,1]
                     ])
 
+def create_rot_axis_batch(axis, radians):
+    '''
+    Create a stack of rotation matrices about one axis, one per angle.
+    Each matrix is the same as create_rot_x/y/z of the angle.
+    Args:
+        :param axis: (str) x, y or z
+        :param radians: (numpy array) the angles in radians
+    '''
+    radians = np.asarray(radians, dtype=float).reshape(-1)
+    c = np.cos(radians)
+    s = np.sin(radians)
+    # a stack of identity matrices, then fill in the
+    # cos/sin entries the same way create_rot_* does
+    rot = np.tile(np.eye(4), (len(radians), 1, 1))
+    if axis == 'x':
+        rot[:,1,1], rot[:,1,2], rot[:,2,1], rot[:,2,2] = c, -s, s, c
+    elif axis == 'y':
+        rot[:,0,0], rot[:,0,2], rot[:,2,0], rot[:,2,2] = c, s, -s, c
+    elif axis == 'z':
+        rot[:,0,0], rot[:,0,1], rot[:,1,0], rot[:,1,1] = c, -s, s, c
+    else:
+        raise ValueError(f'{axis} is not an axis, use x, y or z')
+    return rot
+
+class RotationCache(object):
+    '''
+    Caches rotation matrices by axis and angle, and the x @ y products by
+    x and y angle. A grid of poses only has a few angles per axis and the
+    same x, y for whole runs of z, so most matrices are made once and every
+    frame costs one x @ y times z matmul.
+    '''
+    def __init__(self, maxsize=65536):
+        '''
+        Args:
+            :param maxsize: (int) how many matrices each cache keeps at most,
+            past that new matrices are made but not kept
+        '''
+        self.maxsize = maxsize
+        self.axes = {'x': {}, 'y': {}, 'z': {}}
+        self.products = {}
+
+    def lookup(self, cache, keys, make):
+        '''
+        Return the matrices of unique keys, making the missing ones with make.
+        '''
+        missing = [key for key in keys if key not in cache]
+        made = {}
+        if missing:
+            made = dict(zip(missing, make(missing)))
+            if len(cache) + len(made) <= self.maxsize:
+                cache.update(made)
+        return np.stack([cache[key] if key in cache else made[key] for key in keys])
+
+    def rotations(self, axis, radians):
+        '''
+        Return a stack of rotation matrices about one axis, like create_rot_axis_batch.
+        '''
+        unique, inverse = np.unique(np.asarray(radians, dtype=float), return_inverse=True)
+        matrices = self.lookup(self.axes[axis], unique.tolist(),
+                               lambda angles: create_rot_axis_batch(axis, angles))
+        return matrices[inverse.reshape(-1)]
+
+    def rotation(self, axis, radians):
+        '''
+        Return the rotation matrix about one axis, like create_rot_x/y/z.
+        '''
+        return self.rotations(axis, [radians])[0]
+
+    def batch(self, rotations):
+        '''
+        Return a stack of rotation matrices, the same as create_rot_batch.
+        Args:
+            :param rotations: (numpy array) F x 3 x, y, z rotations in radians
+        '''
+        rotations = np.asarray(rotations, dtype=float).reshape(-1, 3)
+        x, x_inverse = np.unique(rotations[:,0], return_inverse=True)
+        y, y_inverse = np.unique(rotations[:,1], return_inverse=True)
+        z, z_inverse = np.unique(rotations[:,2], return_inverse=True)
+        pairs, pair_inverse = np.unique(x_inverse.reshape(-1)*len(y) + y_inverse.reshape(-1),
+                                        return_inverse=True)
+        if len(pairs) + len(z) > len(rotations):
+            # hardly any angle repeats (random poses), caching won't pay off
+            return create_rot_batch(rotations, cache=None)
+        pairs = np.stack(np.divmod(pairs, len(y)), axis=1)
+        x, y = x[pairs[:,0]].tolist(), y[pairs[:,1]].tolist()
+        products = self.lookup(self.products, list(zip(x, y)),
+                               lambda keys: self.rotations('x', [k[0] for k in keys]) @
+                                            self.rotations('y', [k[1] for k in keys]))
+        z = self.lookup(self.axes['z'], z.tolist(), lambda angles: create_rot_axis_batch('z', angles))
+        return products[pair_inverse.reshape(-1)] @ z[z_inverse.reshape(-1)]
+
+# the cache create_rot_batch uses, other callers can share it
+rotation_cache = RotationCache()
+
+def create_rot_batch(rotations, cache=rotation_cache):
+    '''
+    Create a stack of rotation matrices, one for every x,y,z rotation.
+    Each matrix is the same as create_rot_x(x) @ create_rot_y(y) @ create_rot_z(z)
+    so applying it is the same as calling rotate x, then y, then z.
+    Args:
+        :param rotations: (numpy array) F x 3 where F is the number of frames
+        and the 3 columns are the x, y, z rotations in radians
+        :param cache: (RotationCache) where to keep the matrices that get made,
+        None to make every one
+    '''
+    if cache is not None:
+        return cache.batch(rotations)
+    rotations = np.asarray(rotations, dtype=float).reshape(-1, 3)
+    return (create_rot_axis_batch('x', rotations[:,0]) @
+            create_rot_axis_batch('y', rotations[:,1]) @
+            create_rot_axis_batch('z', rotations[:,2]))
+
+def transform_batch_packed(wireframes, rotations, centers=None):
+    '''
+    Rotate the initial nodes of many wireframes by every x,y,z rotation in one
+    go. The nodes of all wireframes are packed into one array, with offsets
+    to where each wireframe starts, and transformed with a single einsum.
+    Args:
+        :param wireframes: (list) the wireframes to transform
+        :param rotations: (numpy array) F x 3 of x, y, z rotations in radians
+        :param centers: (list) optional x,y,z center per wireframe, every
+        wireframe is translated so its find_center would return its center
+    Returns:
+        (list) one F x N x 4 array per wireframe, views into the packed array
+    '''
+    offsets = np.cumsum([0] + [len(wireframe.nodes_initial) for wireframe in wireframes])
+    packed = np.concatenate([wireframe.nodes_initial for wireframe in wireframes])
+    # float32 wireframes are posed in float32
+    matrices = create_rot_batch(rotations).astype(packed.dtype, copy=False)
+    nodes = np.einsum('nj,fjk->fnk', packed, matrices)
+    if centers is not None:
+        # same as find_center but for every frame and every wireframe
+        min_values = np.minimum.reduceat(nodes[:,:,:-1], offsets[:-1], axis=1)
+        max_values = np.maximum.reduceat(nodes[:,:,:-1], offsets[:-1], axis=1)
+        diff = np.asarray(centers, dtype=float) - 0.5*(min_values + max_values)
+        nodes[:,:,:-1] += np.repeat(diff, np.diff(offsets), axis=1)
+    return [nodes[:,start:stop] for start, stop in zip(offsets[:-1], offsets[1:])]
+
+class Topology(object):
+    '''
+    The parts of a wireframe that never change, its faces, edges and colors,
+    as read-only arrays. Posed copies of a wireframe all share one.
+    '''
+    __slots__ = ('faces', 'edges', 'facecolors', 'nodecolors')
+
+    def __init__(self, faces=[], facecolors=[], nodecolors=[], node_count=None):
+        '''
+        Args:
+            :param faces: (list) Faces x Z node indices, see Wireframe
+            :param facecolors: (list) Faces x 3 RGB colors
+            :param nodecolors: (list) N x 3 RGB colors
+            :param node_count: (int) how many nodes there are, faces with
+            nodes past that get no edges
+        '''
+        # no faces is 0 x 3 so the faces still have a node axis to sort
+        # and take normals over
+        self.faces = np.asarray(faces, dtype=np.int64).reshape(-1, len(faces[0]) if len(faces) else 3)
+        self.facecolors = np.asarray(facecolors, dtype=np.int64).reshape(-1, 3)
+        self.nodecolors = np.asarray(nodecolors, dtype=np.int64)
+        self.edges = np.zeros((0,2), dtype=np.int64)
+        if len(self.faces) and len(self.facecolors):
+            assert self.faces.shape[0] == self.facecolors.shape[0],\
+            'Faces and colors need the same shape!'
+            faces = self.faces
+            if node_count is not None:
+                faces = faces[(faces < node_count).all(axis=1)]
+            # every face joins each node to the one before it, padded
+            # faces repeat their last node which makes no edge
+            edges = np.stack((np.roll(faces, 1, axis=1), faces), axis=2).reshape(-1, 2)
+            self.edges = edges[edges[:,0] != edges[:,1]]
+        for array in (self.faces, self.facecolors, self.nodecolors, self.edges):
+            array.flags.writeable = False
+
 class Wireframe(object):
     '''
     A wireframe for our 3d model.
     '''
-    def __init__(self, nodes, nodecolors=[], faces=[], facecolors=[]):
+    __slots__ = ('nodes', 'nodes_initial', 'topology')
+
+    def __init__(self, nodes, nodecolors=[], faces=[], facecolors=[], dtype=np.float64, topology=None):
         '''
         Creates our wireframe
         Args:
@@ -98,30 +272,55 @@ class Wireframe(object):
              a node, order matters
             :param facecolors: (list) a numpy array of N X 3 where N is the
             number of faces and the columns are RGB values of colors
+            :param dtype: (numpy dtype) the type to store the nodes as, float32
+            halves the memory and computes the poses in float32
+            :param topology: (Topology) share the faces, edges and colors of
+            another wireframe instead of making them from the arguments
         '''
-        self.nodes = np.zeros((0,nodes.shape[1]))
-        ones_col = np.ones((len(nodes), 1))
-        self.nodes = np.hstack((nodes, ones_col))
-        self.nodes_initial = copy.deepcopy(self.nodes)
-        self.edges = np.zeros((0,2)).astype(np.int)
-        self.faces = faces
-        self.facecolors = facecolors
-        self.nodecolors = nodecolors
-
-        if self.faces != [] and self.facecolors != []:
-            for node_list, color in zip(faces, facecolors):
-                if all(node < len(self.nodes) for node in node_list):
-                    new_edges = [[node_list[n-1], node_list[n]] for n in range(len(node_list))]
-                    self.edges = np.vstack((self.edges, new_edges))
+        nodes = np.asarray(nodes, dtype=dtype)
+        # the initial nodes never change, self.nodes points at them until
+        # the wireframe is transformed so a reset needs no copy
+        self.nodes_initial = np.hstack((nodes, np.ones((len(nodes), 1), dtype=dtype)))
+        self.nodes_initial.flags.writeable = False
+        self.nodes = self.nodes_initial
+        if topology is None:
+            topology = Topology(faces, facecolors, nodecolors, len(nodes))
+        self.topology = topology
 
-            assert self.faces.shape[0] == self.facecolors.shape[0],\
-            'Faces and colors need the same shape!'
+    @property
+    def faces(self):
+        return self.topology.faces
+
+    @property
+    def edges(self):
+        return self.topology.edges
+
+    @property
+    def facecolors(self):
+        return self.topology.facecolors
+
+    @property
+    def nodecolors(self):
+        return self.topology.nodecolors
+
+    def pose(self, nodes=None):
+        '''
+        Return a wireframe that shares our initial nodes and topology,
+        posed at nodes (or at our initial nodes).
+        Args:
+            :param nodes: (numpy array) N x 4 nodes of the pose
+        '''
+        posed = Wireframe.__new__(Wireframe)
+        posed.nodes_initial = self.nodes_initial
+        posed.topology = self.topology
+        posed.nodes = self.nodes_initial if nodes is None else nodes
+        return posed
 
     def reset_nodes(self):
         '''
         Reset the list of nodes to how they were originally.
         '''
-        self.nodes = copy.deepcopy(self.nodes_initial)
+        self.nodes = self.nodes_initial
 
     def output_nodes(self):
         '''
@@ -129,7 +328,7 @@ class Wireframe(object):
         e is an extra parameter to make matrix multiplication easier.
         '''
         print(f'\n---{self.nodes.shape[0]} nodes (x, y, z, _) --- ')
-        if self.nodes == []:
+        if not len(self.nodes):
             print('There are no nodes!')
         else:
             for i, (x,y,z,e) in enumerate(self.nodes):
@@ -140,7 +339,7 @@ class Wireframe(object):
         Print the edges of the wireframe
         '''
         print(f'\n--- {self.edges.shape[0]} edges (p1 <-> p2) --- ')
-        if self.edges == []:
+        if not len(self.edges):
             print('There are no edges!')
         else:
             for i, (node1, node2) in enumerate(self.edges):
@@ -151,7 +350,7 @@ class Wireframe(object):
         Print faces of the wireframe
         '''
         print(f'\n---{self.faces.shape[0]} faces --- ')
-        if self.faces == []:
+        if not len(self.faces):
             print('There are no faces!')
         else:
             for i, nodes in enumerate(self.faces):
@@ -164,6 +363,20 @@ class Wireframe(object):
         '''
         self.nodes = self.nodes @ matrix
 
+    def transform_batch(self, rotations, center=None):
+        '''
+        Rotate the initial nodes by every x,y,z rotation at once. This does
+        not touch self.nodes, it returns one set of nodes per rotation.
+        Args:
+            :param rotations: (numpy array) F x 3 of x, y, z rotations in radians
+            :param center: (tuple) optional x,y,z center, if given every frame is
+            translated so its find_center would return this value (like center_wireframe)
+        Returns:
+            (numpy array) F x N x 4 where F is frames and N is nodes
+        '''
+        centers = None if center is None else [center]
+        return transform_batch_packed([self], rotations, centers)[0]
+
     def find_center(self):
         '''
         Find the center of our cube.
@@ -197,9 +410,66 @@ class Wireframe(object):
         needs to also return the colors so they are correct
         with the new sorted array.
         '''
-        return sorted(zip(self.faces,self.facecolors), key=lambda face: min(self.nodes[f,2] for f in face[0]))
+        return [(self.faces[i], self.facecolors[i]) for i in self.sorted_face_indices()]
 
-if __name__ == '__main__':
+    def sorted_face_indices(self, nodes=None):
+        '''
+        Return the indices of the faces sorted by the minimum Z value of their
+        nodes, ties keep their original order like sorted does.
+        Args:
+            :param nodes: (numpy array) N x 4 nodes of one pose or F x N x 4
+            nodes of a batch of poses, defaults to self.nodes
+        Returns:
+            (numpy array) face indices, shape Faces or F x Faces for a batch
+        '''
+        if nodes is None: nodes = self.nodes
+        faces = np.asarray(self.faces)
+        return np.argsort(nodes[...,faces,2].min(axis=-1), axis=-1, kind='stable')
+
+    def face_normals(self, nodes=None):
+        '''
+        Return the normal of every face, the cross product of the vectors
+        from its first node to its second and third nodes.
+        Args:
+            :param nodes: (numpy array) N x 4 nodes of one pose or F x N x 4
+            nodes of a batch of poses, defaults to self.nodes
+        Returns:
+            (numpy array) Faces x 3 or F x Faces x 3 for a batch
+        '''
+        if nodes is None: nodes = self.nodes
+        faces = np.asarray(self.faces)
+        # see this https://www.mathsisfun.com/algebra/vectors-cross-product.html
+        vector1 = nodes[...,faces[:,1],:3] - nodes[...,faces[:,0],:3]
+        vector2 = nodes[...,faces[:,2],:3] - nodes[...,faces[:,0],:3]
+        return np.cross(vector1, vector2)
+
+    def visible_faces(self, nodes=None, threshold=1e-3):
+        '''
+        Sort the faces by depth and find which of them point towards us
+        (the negative z axis), the ones we would draw.
+        Args:
+            :param nodes: (numpy array) N x 4 nodes of one pose or F x N x 4
+            nodes of a batch of poses, defaults to self.nodes
+            :param threshold: (numeric) the cosine of the angle between the
+            normal and the way to us has to be bigger than this, whatever the
+            size of the face, very marginal faces only show their nodes
+        Returns:
+            (tuple) the sorted face indices and a bool mask in the same order
+            of which of them are visible, shape Faces or F x Faces for a
+            batch, for one pose order[visible] are the faces to draw
+        '''
+        if nodes is None: nodes = self.nodes
+        order = self.sorted_face_indices(nodes)
+        normals = self.face_normals(nodes)
+        length = np.linalg.norm(normals, axis=-1)
+        # faces with no area have no normal and are never visible
+        towards_us = -normals[...,2] / np.where(length > 0, length, np.inf)
+        return order, np.take_along_axis(towards_us, order, axis=-1) > threshold
+
+def create_cube():
+    '''
+    Create the cLPR cube, 8 nodes 100 apart with colored faces and nodes.
+    '''
     cube_nodes = [[x,y,z] for x in (0,100) for y in (0,100) for z in (0,100)]
     cube_nodes = np.array(cube_nodes)
     cube_faces = [[0,1,3,2], [7,5,4,6], [4,5,1,0], [2,3,7,6], [0,2,6,4], [5,7,3,1]]
@@ -208,7 +478,10 @@ if __name__ == '__main__':
     cube_colors = np.array(cube_colors)
     cube_node_colors = [[0,255,0],[255,255,0],[0,255,255],[150,150,255],[255, 0, 0],[0,100,255],[255,200,255],[255,255,255]]
     cube_node_colors = np.array(cube_node_colors)
-    cube = Wireframe(cube_nodes, cube_node_colors, cube_faces, cube_colors)
+    return Wireframe(cube_nodes, cube_node_colors, cube_faces, cube_colors)
+
+if __name__ == '__main__':
+    cube = create_cube()
     cube.output_nodes()
     cube.output_edges()
     cube.output_faces()
@@ -0,0 +1,90 @@
+'''
+A bounded write-behind queue for images and labels.
+
+The run loop hands every write (an image to encode and save, a chunk of
+labels to copy into a memmap, a batch of images for the shards) to a pool
+of writer threads and goes on to the next batch. The queue only holds so
+many writes, when it is full submit blocks until a writer is done, so a
+slow disk slows the loop down instead of filling up memory. flush waits for
+every write and raises if one of them failed.
+
+    queue = WriteQueue(threads=4, max_pending=1000)
+    for i, image in enumerate(images):
+        queue.submit(save_image, image, 'cube1', i+1)
+    queue.close()
+'''
+
+import threading
+import concurrent.futures
+
+class WriteQueue(object):
+    '''
+    Runs writes on a pool of threads, holding at most max_pending of them.
+    '''
+    def __init__(self, threads=4, max_pending=1000):
+        '''
+        Args:
+            :param threads: (int) how many writer threads, encoding images
+            and writing files mostly release the GIL
+            :param max_pending: (int) how many writes can wait or run at once
+            before submit blocks
+        '''
+        self.executor = concurrent.futures.ThreadPoolExecutor(threads)
+        self.slots = threading.BoundedSemaphore(max_pending)
+        self.lock = threading.Lock()
+        self.pending = set()
+        # the first write that failed, raised by the next submit or flush
+        self.error = None
+
+    def submit(self, fn, *args):
+        '''
+        Queue fn(*args), blocking while the queue is full.
+        Returns:
+            (Future) the write, its result raises if the write failed
+        '''
+        self.raise_error()
+        self.slots.acquire()
+        try:
+            future = self.executor.submit(fn, *args)
+        except BaseException:
+            self.slots.release()
+            raise
+        with self.lock:
+            self.pending.add(future)
+        future.add_done_callback(self.done)
+        return future
+
+    def done(self, future):
+        '''
+        Free the slot of a finished write and remember if it failed.
+        '''
+        with self.lock:
+            self.pending.discard(future)
+            if self.error is None and not future.cancelled() and future.exception() is not None:
+                self.error = future.exception()
+        self.slots.release()
+
+    def flush(self):
+        '''
+        Wait for every write submitted so far, raises if any of them failed.
+        '''
+        with self.lock:
+            futures = list(self.pending)
+        concurrent.futures.wait(futures)
+        self.raise_error()
+
+    def raise_error(self):
+        '''
+        Raise the error of the first failed write, if there was one.
+        '''
+        if self.error is not None:
+            raise self.error
+
+    def close(self):
+        '''
+        Flush and stop the writer threads.
+        '''
+        try:
+            self.flush()
+        finally:
+            self.executor.shutdown()